@@ -8,9 +8,203 @@ from sklearn.ensemble import RandomForestRegressor, IsolationForest
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Mapping, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import joblib
 import os
+import threading
+import time
+
+# Below this many (row, tree) pairs a forest is walked inline; above it the
+# trees are split across threads (NumPy releases the GIL in the gathers)
+PARALLEL_MIN_WORK = 50_000
+PARALLEL_JOBS = os.cpu_count() or 1
+_tree_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_tree_pool() -> ThreadPoolExecutor:
+    """Shared thread pool for walking forest chunks"""
+    global _tree_pool
+    if _tree_pool is None:
+        _tree_pool = ThreadPoolExecutor(max_workers=PARALLEL_JOBS)
+    return _tree_pool
+
+
+# Column-oriented traffic data: a DataFrame or a dict of equal-length arrays
+TrafficColumns = Union[pd.DataFrame, Mapping[str, np.ndarray]]
+
+# An anomaly detector fit is reused, whatever history arrives, for this long
+ANOMALY_REFIT_SECONDS = 3600
+
+# How often predictions look at disk for a speed model saved by another worker
+MODEL_RECHECK_SECONDS = 30
+
+
+def _file_mtime(path: str) -> Optional[float]:
+    """Modification time of a saved model, or None if it has not been saved yet"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _dump_replacing(value, path: str, **kwargs):
+    """joblib.dump under a temporary name, then swap it in, so other workers never load
+    half a file and existing memory maps of the old file stay valid"""
+    joblib.dump(value, path + '.tmp', **kwargs)
+    os.replace(path + '.tmp', path)
+
+# (hist_avg_speed, hist_std_speed, hist_avg_vehicles) when a segment has no history
+DEFAULT_HIST_STATS = (40.0, 10.0, 25.0)
+
+
+FEATURE_COLUMNS = [
+    'hour', 'day_of_week', 'day_of_month', 'month',
+    'is_weekend', 'is_rush_hour', 'is_night', 'road_segment_id',
+    'hist_avg_speed', 'hist_std_speed', 'hist_avg_vehicles'
+]
+
+
+def _build_features(hour, weekday, day, month, road_segment_id,
+                    hist_avg_speed, hist_std_speed, hist_avg_vehicles) -> np.ndarray:
+    """
+    Write the speed model features into one preallocated (n, 11) array
+    Time components may be scalars (n = 1) or equal-length arrays;
+    road_segment_id and the historical values broadcast against them
+    """
+    hour = np.atleast_1d(np.asarray(hour))
+    weekday = np.asarray(weekday)
+    
+    out = np.empty((len(hour), len(FEATURE_COLUMNS)))
+    out[:, 0] = hour
+    out[:, 1] = weekday
+    out[:, 2] = day
+    out[:, 3] = month
+    out[:, 4] = weekday >= 5
+    out[:, 5] = ((hour >= 7) & (hour <= 9)) | ((hour >= 17) & (hour <= 19))
+    out[:, 6] = (hour < 6) | (hour > 22)
+    out[:, 7] = road_segment_id
+    out[:, 8] = hist_avg_speed
+    out[:, 9] = hist_std_speed
+    out[:, 10] = hist_avg_vehicles
+    return out
+
+
+def _float32_floor(values: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 not above each float64 value
+    For any float32 x, x <= value exactly when x <= _float32_floor(value),
+    so split thresholds can be stored in single precision without changing
+    which way a float32 input goes
+    """
+    rounded = values.astype(np.float32)
+    too_high = rounded > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def _unscale_thresholds(threshold: np.ndarray, feature: np.ndarray,
+                        scaler: StandardScaler) -> np.ndarray:
+    """
+    Move split thresholds from scaled feature space back to raw feature space
+    For each node, finds the largest float32 raw value x whose scaled value
+    float32((x - mean) / scale) still satisfies <= threshold, so raw float32
+    inputs take exactly the branch sklearn takes on the transformed input
+    """
+    n_features = scaler.n_features_in_
+    scale = (scaler.scale_ if scaler.scale_ is not None else np.ones(n_features))[feature]
+    mean = (scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features))[feature]
+    
+    def goes_left(x):
+        return ((x.astype(np.float64) - mean) / scale).astype(np.float32) <= threshold
+    
+    # Algebraic inverse first, then nudge by single ulps where rounding disagrees
+    raw = _float32_floor(threshold * scale + mean)
+    for _ in range(64):
+        up = np.nextafter(raw, np.float32(np.inf))
+        raise_ = goes_left(up)
+        lower = ~goes_left(raw)
+        if not (raise_.any() or lower.any()):
+            break
+        raw[lower] = np.nextafter(raw[lower], np.float32(-np.inf))
+        raw[raise_] = up[raise_]
+    
+    return raw
+
+
+class PackedForest:
+    """
+    Array-only copy of a fitted scikit-learn forest regressor
+    Every tree's nodes are concatenated into a few contiguous arrays, so
+    inference walks all trees for all rows with one vectorized gather per
+    tree level instead of one sklearn predict call per tree
+    
+    When the forest was fit on StandardScaler output, pass that scaler and
+    it is folded into the split thresholds: (x - mean) / scale <= t is the
+    same test as x <= t * scale + mean, so raw features go straight in
+    """
+    
+    def __init__(self, forest, scaler: StandardScaler = None):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        counts = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        node_offset = np.repeat(offsets, counts)
+        
+        left = np.concatenate([tree.children_left for tree in trees])
+        right = np.concatenate([tree.children_right for tree in trees])
+        is_leaf = left == -1
+        node_ids = np.arange(len(left))
+        
+        # Leaves point back at themselves so shallow trees idle until the deepest is done
+        # Node indices fit in int32, halving the bytes each level's gathers touch
+        self.roots = offsets.astype(np.int32)
+        self.left = np.where(is_leaf, node_ids, left + node_offset).astype(np.int32)
+        self.right = np.where(is_leaf, node_ids, right + node_offset).astype(np.int32)
+        self.feature = np.where(
+            is_leaf, 0, np.concatenate([tree.feature for tree in trees])
+        ).astype(np.int32)
+        
+        threshold = np.concatenate([tree.threshold for tree in trees])
+        self.takes_raw_features = scaler is not None
+        if scaler is not None:
+            self.threshold = _unscale_thresholds(threshold, self.feature, scaler)
+        else:
+            self.threshold = _float32_floor(threshold)
+        self.value = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+        self.depth = max(tree.max_depth for tree in trees)
+    
+    def predict_per_tree(self, X: np.ndarray) -> np.ndarray:
+        """
+        Evaluate every tree on every row
+        Returns an (n_rows, n_trees) matrix of tree outputs
+        """
+        # sklearn compares float32 inputs against the split thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_trees = len(self.roots)
+        out = np.empty((len(X), n_trees))
+        
+        n_jobs = min(PARALLEL_JOBS, n_trees)
+        if n_jobs <= 1 or len(X) * n_trees < PARALLEL_MIN_WORK:
+            self._walk(X, np.arange(n_trees), out)
+        else:
+            # Each thread walks its own slice of trees and writes its own columns of out
+            chunks = np.array_split(np.arange(n_trees), n_jobs)
+            list(_get_tree_pool().map(lambda trees: self._walk(X, trees, out), chunks))
+        
+        return out
+    
+    def _walk(self, X: np.ndarray, trees: np.ndarray, out: np.ndarray):
+        """Walk the given trees for every row of X, writing leaf values into out[:, trees]"""
+        rows = np.arange(len(X))[:, None]
+        node = np.tile(self.roots[trees], (len(X), 1))
+        
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        
+        out[:, trees] = self.value[node]
+
 
 class TrafficPredictor:
     """
@@ -18,44 +212,77 @@ class TrafficPredictor:
     For production, this would use LSTM/ARIMA, but RF provides quick baseline
     """
     
+    # Lower speed bound (km/h) of each congestion band after 'severe'
+    _SPEED_BINS = np.array([10, 20, 35, 50])
+    _CONGESTION_STATES = np.array(['severe', 'heavy', 'moderate', 'light', 'free_flow'])
+    
+    # Route factors, their weights in the combined confidence, and per-vehicle adjustments
+    # (buses prefer safer routes and are more sensitive to traffic; emergency prioritizes speed)
+    _ROUTE_FACTORS = ('time_score', 'distance_score', 'safety_score', 'predicted_traffic_score')
+    _ROUTE_FACTOR_WEIGHTS = np.array([0.3, 0.25, 0.2, 0.25])
+    _VEHICLE_WEIGHTS = {
+        'car': np.array([1.0, 1.0, 1.0, 1.0]),
+        'bus': np.array([1.0, 1.0, 1.1, 0.9]),
+        'emergency': np.array([1.2, 1.0, 1.0, 1.0])
+    }
+    
     def __init__(self, model_path: str = "models/"):
         self.model_path = model_path
         self.speed_model = None
+        self.speed_forest = None  # PackedForest compiled from speed_model
+        self._speed_file_mtime = None  # speed_model.pkl version last loaded or saved
+        self._speed_checked_at = None  # time.monotonic() of the last look at speed_model.pkl
         self.congestion_model = None
         self.scaler = StandardScaler()
         self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
+        self.anomaly_fitted_at = None
+        self._anomaly_file_mtime = None  # iforest.pkl version last looked at
+        # Sync endpoints run in a threadpool; a refit must not race with scoring
+        self._anomaly_lock = threading.Lock()
         
         # Create models directory if it doesn't exist
         os.makedirs(model_path, exist_ok=True)
         
-    def prepare_features(self, timestamp: datetime, road_segment_id: int, 
-                        historical_data: pd.DataFrame = None) -> np.ndarray:
+    def historical_stats(self, historical_data: pd.DataFrame = None) -> Tuple[float, float, float]:
+        """
+        Reduce recent history for a segment to the three historical features
+        Returns (hist_avg_speed, hist_std_speed, hist_avg_vehicles)
+        """
+        if historical_data is not None and len(historical_data) > 0:
+            return (
+                historical_data['average_speed'].mean(),
+                historical_data['average_speed'].std(),
+                historical_data['vehicle_count'].mean()
+            )
+        return DEFAULT_HIST_STATS
+    
+    def prepare_features(self, timestamp: datetime, road_segment_id: int,
+                        hist_avg_speed: float = 40.0,
+                        hist_std_speed: float = 10.0,
+                        hist_avg_vehicles: float = 25.0) -> np.ndarray:
         """
         Extract time-based features from timestamp
+        Historical averages come precomputed from historical_stats
         In production, would include weather, events, etc.
         """
-        features = {
-            'hour': timestamp.hour,
-            'day_of_week': timestamp.weekday(),
-            'day_of_month': timestamp.day,
-            'month': timestamp.month,
-            'is_weekend': 1 if timestamp.weekday() >= 5 else 0,
-            'is_rush_hour': 1 if timestamp.hour in [7, 8, 9, 17, 18, 19] else 0,
-            'is_night': 1 if timestamp.hour < 6 or timestamp.hour > 22 else 0,
-            'road_segment_id': road_segment_id
-        }
-        
-        # Add historical averages if available
-        if historical_data is not None and len(historical_data) > 0:
-            features['hist_avg_speed'] = historical_data['average_speed'].mean()
-            features['hist_std_speed'] = historical_data['average_speed'].std()
-            features['hist_avg_vehicles'] = historical_data['vehicle_count'].mean()
-        else:
-            features['hist_avg_speed'] = 40.0  # Default baseline
-            features['hist_std_speed'] = 10.0
-            features['hist_avg_vehicles'] = 25.0
-        
-        return np.array(list(features.values())).reshape(1, -1)
+        return _build_features(
+            timestamp.hour, timestamp.weekday(), timestamp.day, timestamp.month,
+            road_segment_id, hist_avg_speed, hist_std_speed, hist_avg_vehicles
+        )
+    
+    def _feature_matrix(self, timestamps, road_segment_id,
+                        hist_avg_speed: float = 40.0,
+                        hist_std_speed: float = 10.0,
+                        hist_avg_vehicles: float = 25.0) -> np.ndarray:
+        """
+        Vectorized prepare_features for many timestamps at once
+        Returns an (n, 11) matrix with the same column order
+        """
+        ts = pd.DatetimeIndex(timestamps)
+        return _build_features(
+            ts.hour, ts.weekday, ts.day, ts.month,
+            road_segment_id, hist_avg_speed, hist_std_speed, hist_avg_vehicles
+        )
     
     def train_speed_model(self, training_data: pd.DataFrame):
         """
@@ -64,20 +291,14 @@ class TrafficPredictor:
         if len(training_data) < 50:
             raise ValueError("Insufficient training data (need at least 50 samples)")
         
-        # Prepare features
-        X = []
+        # Prepare features (no historical context during training)
         y = training_data['average_speed'].values
-        
-        for idx, row in training_data.iterrows():
-            timestamp = pd.to_datetime(row['timestamp'])
-            features = self.prepare_features(
-                timestamp, 
-                row.get('road_segment_id', 1),
-                None  # No historical context during training
-            )
-            X.append(features[0])
-        
-        X = np.array(X)
+        timestamps = pd.to_datetime(training_data['timestamp'])
+        if 'road_segment_id' in training_data:
+            road_segment_id = training_data['road_segment_id'].fillna(1).values
+        else:
+            road_segment_id = 1
+        X = self._feature_matrix(timestamps, road_segment_id)
         
         # Train/test split
         X_train, X_test, y_train, y_test = train_test_split(
@@ -96,6 +317,7 @@ class TrafficPredictor:
             n_jobs=-1
         )
         self.speed_model.fit(X_train_scaled, y_train)
+        self.speed_forest = PackedForest(self.speed_model, self.scaler)
         
         # Evaluate
         train_score = self.speed_model.score(X_train_scaled, y_train)
@@ -109,46 +331,109 @@ class TrafficPredictor:
         return test_score
     
     def predict_speed(self, timestamp: datetime, road_segment_id: int, 
-                     historical_data: pd.DataFrame = None) -> Dict:
+                     historical_data: pd.DataFrame = None,
+                     hist_stats: Optional[Tuple[float, float, float]] = None) -> Dict:
         """
         Predict average speed for given timestamp and road segment
+        Pass hist_stats (from historical_stats) to skip reducing historical_data again
         """
-        if self.speed_model is None:
-            # Try to load saved model
-            if not self.load_model('speed_model'):
-                # Return baseline prediction if no model
-                return {
-                    'predicted_speed': 40.0,
-                    'confidence': 0.5,
-                    'model': 'baseline',
-                    'lower_bound': 30.0,
-                    'upper_bound': 50.0
-                }
+        if not self._speed_model_ready():
+            # Return baseline prediction if no model
+            return {
+                'predicted_speed': 40.0,
+                'confidence': 0.5,
+                'model': 'baseline',
+                'lower_bound': 30.0,
+                'upper_bound': 50.0
+            }
         
         # Prepare features
-        features = self.prepare_features(timestamp, road_segment_id, historical_data)
-        features_scaled = self.scaler.transform(features)
-        
-        # Predict
-        prediction = self.speed_model.predict(features_scaled)[0]
-        
-        # Estimate confidence using tree variance
-        tree_predictions = np.array([
-            tree.predict(features_scaled)[0] 
-            for tree in self.speed_model.estimators_
-        ])
-        std = np.std(tree_predictions)
+        if hist_stats is None:
+            hist_stats = self.historical_stats(historical_data)
+        features = self.prepare_features(timestamp, road_segment_id, *hist_stats)
+        prediction, std = self._predict_with_spread(features)
+        prediction, std = prediction[0], std[0]
         confidence = max(0.0, min(1.0, 1.0 - (std / 20.0)))  # Normalize to 0-1
         
         return {
             'predicted_speed': round(float(prediction), 2),
-            'confidence': round(confidence, 3),
+            'confidence': round(float(confidence), 3),
             'model': 'random_forest',
             'lower_bound': round(float(prediction - 2 * std), 2),
             'upper_bound': round(float(prediction + 2 * std), 2),
             'std_dev': round(float(std), 2)
         }
     
+    def predict_speed_batch(self, timestamps, road_segment_id: int,
+                            historical_data: pd.DataFrame = None,
+                            hist_stats: Optional[Tuple[float, float, float]] = None) -> Dict:
+        """
+        Predict average speed for many timestamps on one road segment
+        Same fields as predict_speed, but each value is an array aligned with timestamps
+        """
+        n = len(timestamps)
+        if not self._speed_model_ready():
+            # Return baseline prediction if no model
+            return {
+                'predicted_speed': np.full(n, 40.0),
+                'confidence': np.full(n, 0.5),
+                'model': 'baseline',
+                'lower_bound': np.full(n, 30.0),
+                'upper_bound': np.full(n, 50.0)
+            }
+        
+        # Historical averages are shared by every timestamp in the batch
+        if hist_stats is None:
+            hist_stats = self.historical_stats(historical_data)
+        
+        if n == 0:
+            prediction = std = np.empty(0)
+        else:
+            features = self._feature_matrix(timestamps, road_segment_id, *hist_stats)
+            prediction, std = self._predict_with_spread(features)
+        confidence = np.clip(1.0 - (std / 20.0), 0.0, 1.0)  # Normalize to 0-1
+        
+        return {
+            'predicted_speed': np.round(prediction, 2),
+            'confidence': np.round(confidence, 3),
+            'model': 'random_forest',
+            'lower_bound': np.round(prediction - 2 * std, 2),
+            'upper_bound': np.round(prediction + 2 * std, 2),
+            'std_dev': np.round(std, 2)
+        }
+    
+    def _speed_model_ready(self) -> bool:
+        """
+        Whether a speed model is available, (re)loading the saved one when its file has
+        changed, so a model trained by another worker is picked up. The file is looked at
+        on first use and then at most every MODEL_RECHECK_SECONDS
+        """
+        now = time.monotonic()
+        if self._speed_checked_at is not None and now - self._speed_checked_at < MODEL_RECHECK_SECONDS:
+            return self.speed_forest is not None
+        self._speed_checked_at = now
+        mtime = _file_mtime(os.path.join(self.model_path, 'speed_model.pkl'))
+        if mtime is not None and mtime != self._speed_file_mtime:
+            self._speed_file_mtime = mtime
+            self.load_model('speed_model')
+        return self.speed_forest is not None
+    
+    def _predict_with_spread(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Predict speeds for a feature matrix and the per-row spread across trees
+        Returns (prediction, std), each of shape (n,)
+        """
+        # The packed forest has the scaler folded in, so raw features go straight in
+        if not getattr(self.speed_forest, 'takes_raw_features', False):
+            features = self.scaler.transform(features)
+        
+        # The forest prediction is the mean over trees; the spread gives confidence
+        tree_predictions = self.speed_forest.predict_per_tree(features)
+        prediction = tree_predictions.mean(axis=1)
+        std = tree_predictions.std(axis=1)
+        
+        return prediction, std
+    
     def predict_congestion(self, predicted_speed: float) -> str:
         """
         Map predicted speed to congestion state
@@ -164,49 +449,115 @@ class TrafficPredictor:
         else:
             return 'severe'
     
-    def detect_anomalies(self, current_data: pd.DataFrame, 
-                        training_data: pd.DataFrame = None) -> List[Dict]:
+    def predict_congestion_batch(self, predicted_speeds: np.ndarray) -> np.ndarray:
+        """
+        Map an array of predicted speeds to congestion states
+        Same bands as predict_congestion, resolved with one searchsorted
+        """
+        bins = np.searchsorted(self._SPEED_BINS, predicted_speeds, side='right')
+        return self._CONGESTION_STATES[bins]
+    
+    def detect_anomalies(self, current_data: TrafficColumns,
+                        training_data: TrafficColumns = None) -> List[Dict]:
         """
         Detect traffic anomalies using Isolation Forest
+        Both inputs only need 'average_speed' and 'vehicle_count' columns, given as a
+        DataFrame or a dict of equal-length arrays; current_data also needs 'timestamp'
         """
-        if training_data is not None and len(training_data) > 50:
-            # Train anomaly detector on historical data
-            X_train = training_data[['average_speed', 'vehicle_count']].values
-            self.anomaly_detector.fit(X_train)
+        speeds = np.asarray(current_data['average_speed'])
+        counts = np.asarray(current_data['vehicle_count'])
+        X_current = np.column_stack([speeds, counts])
         
-        # Detect anomalies in current data
-        X_current = current_data[['average_speed', 'vehicle_count']].values
-        anomaly_scores = self.anomaly_detector.decision_function(X_current)
-        predictions = self.anomaly_detector.predict(X_current)
+        with self._anomaly_lock:
+            if training_data is not None and len(training_data['average_speed']) > 50:
+                self._fit_anomaly_detector(training_data)
+            
+            # Detect anomalies in current data
+            # One pass over the trees; decision_function and predict both derive from
+            # score_samples shifted by offset_, with negative values flagged as anomalies
+            detector = self.anomaly_detector
+            anomaly_scores = detector.score_samples(X_current) - detector.offset_
         
-        anomalies = []
-        for idx, (score, pred) in enumerate(zip(anomaly_scores, predictions)):
-            if pred == -1:  # Anomaly detected
-                row = current_data.iloc[idx]
-                
-                # Determine anomaly type
-                if row['average_speed'] < 10:
-                    anomaly_type = 'severe_slowdown'
-                    severity = 'critical'
-                elif row['vehicle_count'] > 100:
-                    anomaly_type = 'high_volume'
-                    severity = 'high'
-                else:
-                    anomaly_type = 'unusual_pattern'
-                    severity = 'medium'
-                
-                anomalies.append({
-                    'road_segment_id': row.get('road_segment_id', 0),
-                    'timestamp': row['timestamp'],
-                    'anomaly_type': anomaly_type,
-                    'severity': severity,
-                    'anomaly_score': round(float(-score), 3),  # Convert to positive
-                    'speed': row['average_speed'],
-                    'vehicle_count': row['vehicle_count']
-                })
+        flagged = np.flatnonzero(anomaly_scores < 0)
+        speeds = speeds[flagged]
+        counts = counts[flagged]
+        timestamps = np.asarray(current_data['timestamp'])[flagged]
+        if timestamps.dtype.kind == 'M':
+            # Nanosecond datetime64 would turn into plain ints in tolist()
+            timestamps = timestamps.astype('datetime64[us]')
+        
+        # Determine anomaly type; earlier conditions win, as in an if/elif chain
+        conditions = [speeds < 10, counts > 100]
+        anomaly_types = np.select(conditions, ['severe_slowdown', 'high_volume'], 'unusual_pattern')
+        severities = np.select(conditions, ['critical', 'high'], 'medium')
+        
+        if 'road_segment_id' in current_data:
+            segment_ids = np.asarray(current_data['road_segment_id'])[flagged].tolist()
+        else:
+            segment_ids = [0] * len(flagged)
+        
+        anomalies = [
+            {
+                'road_segment_id': segment_id,
+                'timestamp': timestamp,
+                'anomaly_type': anomaly_type,
+                'severity': severity,
+                'anomaly_score': round(-score, 3),  # Convert to positive
+                'speed': speed,
+                'vehicle_count': count
+            }
+            for segment_id, timestamp, anomaly_type, severity, score, speed, count in zip(
+                segment_ids,
+                timestamps.tolist(),
+                anomaly_types.tolist(),
+                severities.tolist(),
+                anomaly_scores[flagged].tolist(),
+                speeds.tolist(),
+                counts.tolist()
+            )
+        ]
         
         return anomalies
     
+    def anomaly_detector_fresh(self) -> bool:
+        """
+        Whether a detector fit within ANOMALY_REFIT_SECONDS is available, here or saved
+        by another process; callers can then skip loading training history
+        """
+        with self._anomaly_lock:
+            return self._anomaly_fresh()
+    
+    def _anomaly_fresh(self) -> bool:
+        # Caller holds _anomaly_lock
+        if not self._anomaly_age_ok():
+            # Only re-read the saved detector when the file has changed
+            mtime = _file_mtime(os.path.join(self.model_path, 'iforest.pkl'))
+            if mtime is not None and mtime != self._anomaly_file_mtime:
+                self._anomaly_file_mtime = mtime
+                self.load_model('anomaly_detector')
+        return self._anomaly_age_ok()
+    
+    def _anomaly_age_ok(self) -> bool:
+        return (self.anomaly_fitted_at is not None
+                and (datetime.now() - self.anomaly_fitted_at).total_seconds() < ANOMALY_REFIT_SECONDS)
+    
+    def _fit_anomaly_detector(self, training_data: TrafficColumns):
+        """
+        Train anomaly detector on historical data
+        Skipped while the current fit is younger than ANOMALY_REFIT_SECONDS; the new fit
+        is not written to disk here, callers persist it with save_model off the request path
+        """
+        if self._anomaly_fresh():
+            return
+        
+        X_train = np.column_stack([
+            np.asarray(training_data['average_speed']),
+            np.asarray(training_data['vehicle_count'])
+        ])
+        # A new estimator rather than refitting in place, so save_model can pickle the old one meanwhile
+        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42).fit(X_train)
+        self.anomaly_fitted_at = datetime.now()
+    
     def recommend_route(self, origin: Tuple[float, float], 
                        destination: Tuple[float, float],
                        vehicle_type: str = 'car',
@@ -216,55 +567,81 @@ class TrafficPredictor:
         Simple heuristic-based recommendation
         In production, would use collaborative filtering + ML
         """
-        # Calculate base scores
-        time_score = 0.85 if time_preference == 'fastest' else 0.60
-        distance_score = 0.75
-        safety_score = 0.90
-        traffic_score = 0.70  # Would come from prediction
-        
-        # Adjust for vehicle type
-        if vehicle_type == 'bus':
-            safety_score *= 1.1  # Prefer safer routes
-            traffic_score *= 0.9  # More sensitive to traffic
-        elif vehicle_type == 'emergency':
-            time_score *= 1.2  # Prioritize speed
-        
-        # Combined confidence
-        confidence = (time_score * 0.3 + distance_score * 0.25 + 
-                     safety_score * 0.2 + traffic_score * 0.25)
+        confidence, factors = self._route_scores(vehicle_type, time_preference)
         
         return {
-            'confidence': round(confidence, 3),
-            'factors': {
-                'time_score': round(time_score, 3),
-                'distance_score': round(distance_score, 3),
-                'safety_score': round(safety_score, 3),
-                'predicted_traffic_score': round(traffic_score, 3)
-            },
+            'confidence': confidence,
+            'factors': dict(zip(self._ROUTE_FACTORS, factors)),
             'estimated_time_min': 25,
             'estimated_distance_km': 12.5,
             'route_type': 'ai_recommended'
         }
     
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _route_scores(vehicle_type: str, time_preference: str) -> Tuple[float, Tuple[float, ...]]:
+        """
+        Rounded (confidence, factor scores) for a vehicle type and time preference
+        Only depends on its two arguments, so every combination is computed once
+        """
+        # Base scores; the traffic score would come from prediction
+        base = np.array([0.85 if time_preference == 'fastest' else 0.60, 0.75, 0.90, 0.70])
+        scores = base * TrafficPredictor._VEHICLE_WEIGHTS.get(vehicle_type, 1.0)
+        
+        # Combined confidence
+        confidence = float(scores @ TrafficPredictor._ROUTE_FACTOR_WEIGHTS)
+        return round(confidence, 3), tuple(np.round(scores, 3).tolist())
+    
     def save_model(self, model_name: str):
         """Save trained model to disk"""
         if model_name == 'speed_model' and self.speed_model is not None:
-            joblib.dump(self.speed_model, os.path.join(self.model_path, 'speed_model.pkl'))
-            joblib.dump(self.scaler, os.path.join(self.model_path, 'scaler.pkl'))
+            _dump_replacing(self.scaler, os.path.join(self.model_path, 'scaler.pkl'))
+            # Left uncompressed so load_model can memory-map the node arrays
+            _dump_replacing(self.speed_forest, os.path.join(self.model_path, 'speed_forest.pkl'))
+            # Written last: other workers reload when this file changes.
+            # sklearn trees copy their nodes on unpickle, so this file can be compressed
+            path = os.path.join(self.model_path, 'speed_model.pkl')
+            _dump_replacing(self.speed_model, path, compress=3)
+            self._speed_file_mtime = _file_mtime(path)
             print(f"Model saved to {self.model_path}")
+        elif model_name == 'anomaly_detector':
+            with self._anomaly_lock:
+                saved = {'detector': self.anomaly_detector, 'fitted_at': self.anomaly_fitted_at}
+            if saved['fitted_at'] is None:
+                return
+            _dump_replacing(saved, os.path.join(self.model_path, 'iforest.pkl'))
     
     def load_model(self, model_name: str) -> bool:
         """Load trained model from disk"""
         try:
             if model_name == 'speed_model':
-                model_file = os.path.join(self.model_path, 'speed_model.pkl')
-                scaler_file = os.path.join(self.model_path, 'scaler.pkl')
+                scaler = joblib.load(os.path.join(self.model_path, 'scaler.pkl'))
+                
+                # Inference only needs the packed forest; the sklearn model is not kept per worker
+                try:
+                    # Read-only mapping: workers share the node arrays via the page cache
+                    speed_forest = joblib.load(
+                        os.path.join(self.model_path, 'speed_forest.pkl'), mmap_mode='r'
+                    )
+                except FileNotFoundError:
+                    # Models saved before the packed forest existed are compiled on load,
+                    # after which the unpickled sklearn model is dropped
+                    speed_forest = PackedForest(
+                        joblib.load(os.path.join(self.model_path, 'speed_model.pkl')), scaler
+                    )
                 
-                if os.path.exists(model_file) and os.path.exists(scaler_file):
-                    self.speed_model = joblib.load(model_file)
-                    self.scaler = joblib.load(scaler_file)
-                    print(f"Model loaded from {self.model_path}")
-                    return True
+                self.scaler, self.speed_forest = scaler, speed_forest
+                print(f"Model loaded from {self.model_path}")
+                return True
+            elif model_name == 'anomaly_detector':
+                saved = joblib.load(os.path.join(self.model_path, 'iforest.pkl'))
+                # Never replace a newer fit made in this process with an older saved one
+                if self.anomaly_fitted_at is None or saved['fitted_at'] > self.anomaly_fitted_at:
+                    self.anomaly_detector = saved['detector']
+                    self.anomaly_fitted_at = saved['fitted_at']
+                return True
+        except FileNotFoundError:
+            pass  # Not trained yet
         except Exception as e:
             print(f"Error loading model: {e}")
         
@@ -273,8 +650,8 @@ class TrafficPredictor:
     def get_model_stats(self) -> Dict:
         """Get model performance statistics"""
         return {
-            'speed_model_loaded': self.speed_model is not None,
-            'last_trained': datetime.now().isoformat() if self.speed_model else None,
+            'speed_model_loaded': self.speed_forest is not None,
+            'last_trained': datetime.now().isoformat() if self.speed_forest is not None else None,
             'model_type': 'random_forest',
             'features_count': 11,
             'anomaly_detector_ready': True
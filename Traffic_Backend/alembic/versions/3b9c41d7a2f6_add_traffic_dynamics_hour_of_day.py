@@ -0,0 +1,30 @@
+"""add traffic_dynamics hour_of_day
+Revision ID: 3b9c41d7a2f6
+Revises: e02157e374ac
+Create Date: 2026-10-15 13:42:37.906115
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3b9c41d7a2f6'
+down_revision = 'e02157e374ac'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('traffic_dynamics', sa.Column('hour_of_day', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_traffic_dynamics_hour_of_day'), 'traffic_dynamics', ['hour_of_day'])
+
+    # Backfill existing rows; new rows are populated by the ORM on insert
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE traffic_dynamics SET hour_of_day = CAST(strftime('%H', timestamp) AS INTEGER)")
+    else:
+        op.execute("UPDATE traffic_dynamics SET hour_of_day = HOUR(timestamp)")
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_traffic_dynamics_hour_of_day'), table_name='traffic_dynamics')
+    op.drop_column('traffic_dynamics', 'hour_of_day')
@@ -0,0 +1,22 @@
+"""add unique traffic_thresholds segment index
+Revision ID: 5f7a2c9e1b48
+Revises: 9d2e6f0a8c13
+Create Date: 2026-10-15 16:02:44.117305
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5f7a2c9e1b48'
+down_revision = '9d2e6f0a8c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tt_segid', 'traffic_thresholds', ['road_segment_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tt_segid', table_name='traffic_thresholds')
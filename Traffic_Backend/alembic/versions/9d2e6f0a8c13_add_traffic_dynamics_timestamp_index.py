@@ -0,0 +1,22 @@
+"""add traffic_dynamics timestamp index
+Revision ID: 9d2e6f0a8c13
+Revises: 3b9c41d7a2f6
+Create Date: 2026-10-15 14:20:05.631482
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9d2e6f0a8c13'
+down_revision = '3b9c41d7a2f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_td_timestamp', 'traffic_dynamics', ['timestamp'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_td_timestamp', table_name='traffic_dynamics')
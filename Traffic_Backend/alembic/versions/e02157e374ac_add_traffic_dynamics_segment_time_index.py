@@ -0,0 +1,26 @@
+"""add traffic_dynamics segment/time index
+Revision ID: e02157e374ac
+Revises: fdbbc179a45f
+Create Date: 2026-10-15 11:05:12.418233
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e02157e374ac'
+down_revision = 'fdbbc179a45f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_td_seg_ts',
+        'traffic_dynamics',
+        ['road_segment_id', sa.text('timestamp DESC')]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_td_seg_ts', table_name='traffic_dynamics')
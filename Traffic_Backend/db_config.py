@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 import os
 from urllib.parse import quote_plus
 
@@ -15,10 +16,21 @@ if not DATABASE_URL:
 	encoded_password = quote_plus(MYSQL_PASSWORD)
 	DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{encoded_password}@{MYSQL_HOST}/{MYSQL_DB}"
 
+# Connection pool for the primary database; keep pool size + overflow per worker below the
+# server's max_connections divided by the number of workers
+DB_POOL_OPTIONS = dict(
+	pool_size=int(os.getenv('DB_POOL_SIZE', '20')),
+	max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+	pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),
+	pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+	pool_pre_ping=True,
+)
+
 # Try to create engine for MySQL; if connection/auth fails, fall back to SQLite for local dev
 def _create_engine_with_fallback():
 	try:
-		engine = create_engine(DATABASE_URL, echo=True)
+		pool_options = DB_POOL_OPTIONS if not DATABASE_URL.startswith('sqlite') else {}
+		engine = create_engine(DATABASE_URL, echo=True, **pool_options)
 		# Test connection
 		with engine.connect() as conn:
 			pass
@@ -31,6 +43,25 @@ def _create_engine_with_fallback():
 		return engine
 
 engine = _create_engine_with_fallback()
+
+# SQLite tuning applied to every new connection: WAL so readers don't block the writer,
+# a 64 MB page cache, 256 MB of memory-mapped I/O and in-memory temp tables
+SQLITE_PRAGMAS = (
+	"PRAGMA journal_mode=WAL",
+	"PRAGMA synchronous=NORMAL",
+	"PRAGMA cache_size=-65536",
+	"PRAGMA mmap_size=268435456",
+	"PRAGMA temp_store=MEMORY",
+)
+
+if engine.dialect.name == 'sqlite':
+	@event.listens_for(engine, "connect")
+	def _set_sqlite_pragmas(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		for pragma in SQLITE_PRAGMAS:
+			cursor.execute(pragma)
+		cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -41,3 +72,28 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+_DIALECT_INSERTS = {'mysql': mysql.insert, 'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def upsert(db, table, values, conflict_columns, update_columns=()):
+    """
+    Build a single-statement INSERT that updates update_columns when a row with the same
+    conflict_columns exists (ON CONFLICT DO UPDATE / ON DUPLICATE KEY UPDATE).
+    With no update_columns the conflicting insert is ignored instead (ON CONFLICT DO NOTHING);
+    MySQL has no equivalent, so callers there insert normally and handle IntegrityError.
+    """
+    dialect = db.get_bind().dialect.name
+    stmt = _DIALECT_INSERTS[dialect](table).values(**values)
+    if dialect == 'mysql':
+        if not update_columns:
+            # INSERT IGNORE would also turn truncation and NOT NULL errors into silent warnings
+            raise ValueError("MySQL upsert needs update_columns; insert and catch IntegrityError instead")
+        return stmt.on_duplicate_key_update({col: stmt.inserted[col] for col in update_columns})
+    if not update_columns:
+        return stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+    return stmt.on_conflict_do_update(
+        index_elements=list(conflict_columns),
+        set_={col: stmt.excluded[col] for col in update_columns}
+    )
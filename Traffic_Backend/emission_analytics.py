@@ -1,6 +1,7 @@
 """
 Emission analytics module for calculating CO2 savings from route optimization.
 """
+import numpy as np
 
 def calculate_emission_savings(time_original: float, time_optimized: float) -> float:
     """
@@ -35,3 +36,24 @@ def calculate_emission_savings(time_original: float, time_optimized: float) -> f
     else:
         return 0.0  # No savings if route is not shorter
 
+
+def calculate_emission_savings_batch(time_original: np.ndarray, time_optimized: np.ndarray) -> np.ndarray:
+    """
+    Vectorized calculate_emission_savings for many route pairs at once.
+    
+    Applies the same rules element-wise: invalid inputs (original time <= 0 or
+    optimized time < 0) and routes that are not shorter give 0.
+    Unlike the scalar version the result is not rounded; format at display time.
+    
+    Args:
+        time_original (np.ndarray): Travel times for the original routes (in hours)
+        time_optimized (np.ndarray): Travel times for the optimized routes (in hours)
+    
+    Returns:
+        np.ndarray: CO2 emission savings per route pair
+    """
+    time_original = np.asarray(time_original, dtype=float)
+    time_optimized = np.asarray(time_optimized, dtype=float)
+    
+    valid = (time_original > 0) & (time_optimized >= 0)
+    return np.where(valid, np.maximum(time_original - time_optimized, 0.0), 0.0)
@@ -0,0 +1,61 @@
+"""
+Graph Index Module
+Cached node coordinates, KD-tree and edge-length table for the road network graph
+"""
+import numpy as np
+
+# Optional spatial index for nearest-node lookups; without it lookups scan node_coords
+try:
+    from scipy.spatial import cKDTree  # type: ignore
+except Exception:
+    cKDTree = None  # type: ignore
+
+
+def index_graph_nodes(G) -> None:
+    """
+    Cache node coordinates and a KD-tree for nearest-node lookups on the graph,
+    plus a flat edge table for summing path lengths.
+    
+    Stored in G.graph so the index is always replaced together with the graph:
+        node_list: nodes in index order
+        node_id: node -> row in node_coords
+        node_coords: (n, 2) array of (lon, lat)
+        kdtree: cKDTree over node_coords, or None if scipy is unavailable
+        edge_keys: (m,) sorted int64 keys u_idx * n + v_idx, one per edge (CSR order)
+        edge_lengths: (m,) array of edge 'length' attributes aligned with edge_keys
+        indexed_size: (nodes, edges) counted when the index was built
+    """
+    node_list = list(G.nodes())
+    node_id = {node: i for i, node in enumerate(node_list)}
+    node_coords = np.asarray(node_list, dtype=np.float64).reshape(-1, 2)
+    edge_list = list(G.edges(data='length', default=0))
+    
+    edge_keys = np.fromiter(
+        (node_id[u] * len(node_list) + node_id[v] for u, v, _ in edge_list), dtype=np.int64, count=len(edge_list)
+    )
+    edge_lengths = np.fromiter(
+        (length for _, _, length in edge_list), dtype=np.float64, count=len(edge_list)
+    )
+    order = np.argsort(edge_keys)
+    
+    G.graph['node_list'] = node_list
+    G.graph['node_id'] = node_id
+    G.graph['node_coords'] = node_coords
+    G.graph['kdtree'] = cKDTree(node_coords) if cKDTree is not None and node_list else None
+    G.graph['edge_keys'] = edge_keys[order]
+    G.graph['edge_lengths'] = edge_lengths[order]
+    G.graph['indexed_size'] = (len(node_list), len(edge_list))
+
+
+def edge_lengths_along(G, path) -> np.ndarray:
+    """Lengths of the consecutive edges of a path, looked up by integer node index."""
+    node_id = G.graph['node_id']
+    ids = np.fromiter((node_id[node] for node in path), dtype=np.int64, count=len(path))
+    keys = ids[:-1] * len(node_id) + ids[1:]
+    return G.graph['edge_lengths'][np.searchsorted(G.graph['edge_keys'], keys)]
+
+
+def ensure_graph_index(G) -> None:
+    """Build the index if the graph has none, or rebuild it if nodes or edges were added or removed since."""
+    if G.graph.get('indexed_size') != (G.number_of_nodes(), G.number_of_edges()):
+        index_graph_nodes(G)
@@ -2,6 +2,7 @@ from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from .auth import require_role
 from .routers.projects import router as projects_router
+from .graph_index import index_graph_nodes
 import pandas as pd
 import io
 from typing import Optional, Tuple
@@ -128,6 +129,8 @@ async def _diagnostic_shutdown():
 # Global variables to store road network data
 road_network_gdf: Optional[object] = None
 road_network_graph: Optional[object] = None
+# Routers read the graph from app.state instead of importing this module per request
+app.state.road_network_graph = None
 damaged_roads_df: Optional[pd.DataFrame] = None  # Store ingested damaged roads data
 
 # Tolerance for snapping GPS points (in degrees)
@@ -252,6 +255,7 @@ def initialize_networkx_graph(road_network) -> object:
                 # Uncomment below if roads are bidirectional
                 # G.add_edge(end_node, start_node, **edge_attrs)
     
+    index_graph_nodes(G)
     return G
 
 
@@ -283,6 +287,8 @@ async def upload_road_network(file: UploadFile = File(...), user=Depends(require
         
         # Initialize NetworkX graph
         road_network_graph = initialize_networkx_graph(road_network_gdf)
+        app.state.road_network_graph = road_network_graph
+        clear_path_cache()
         
         return {
             "message": "Road network loaded successfully",
@@ -522,7 +528,7 @@ async def health():
 
 # auth routes are provided in the routers/auth.py router
 from .routers.auth import router as auth_router
-from .routers.routes import router as routes_router
+from .routers.routes import router as routes_router, clear_path_cache
 from .routers.traffic import router as traffic_router
 from .routers.notifications import router as notifications_router
 from .routers.users import router as users_router
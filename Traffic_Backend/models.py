@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -37,8 +37,21 @@ class TrafficDynamics(Base):
     congestion_state = Column(String(32))
     vehicle_count = Column(Integer)
     average_speed = Column(Float)
+    # Materialized hour of `timestamp` so hourly aggregates group on an indexed column
+    hour_of_day = Column(Integer, index=True)
     road_segment = relationship('RoadNetwork')
 
+# Per-segment history lookups filter on segment and a recent timestamp window
+Index('ix_td_seg_ts', TrafficDynamics.road_segment_id, TrafficDynamics.timestamp.desc())
+# Analytics windows filter on timestamp alone across all segments
+Index('ix_td_timestamp', TrafficDynamics.timestamp)
+
+
+@event.listens_for(TrafficDynamics, 'before_insert')
+@event.listens_for(TrafficDynamics, 'before_update')
+def _set_hour_of_day(mapper, connection, target):
+    target.hour_of_day = target.timestamp.hour if target.timestamp is not None else None
+
 class DamageCluster(Base):
     __tablename__ = 'damage_clusters'
     id = Column(Integer, primary_key=True)
@@ -80,6 +93,9 @@ class TrafficThreshold(Base):
     alert_type = Column(String(32), nullable=True)
     is_active = Column(Integer, default=1)
 
+# One threshold per segment; lookups and the configure upsert go through this index
+Index('ix_tt_segid', TrafficThreshold.road_segment_id, unique=True)
+
 
 class Vehicle(Base):
     __tablename__ = 'vehicles'
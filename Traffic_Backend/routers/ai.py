@@ -3,18 +3,40 @@ AI Router
 AI-powered prediction, anomaly detection, and route recommendation endpoints
 """
 from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 
-from Traffic_Backend.db_config import get_db
+from Traffic_Backend.db_config import get_db, SessionLocal
 from Traffic_Backend.models import TrafficDynamics, RoadNetwork
 from Traffic_Backend.ai_predictor import predictor
 
-router = APIRouter(prefix="/ai", tags=["ai"])
+router = APIRouter(prefix="/ai", tags=["ai"], default_response_class=ORJSONResponse)
+
+# Rows fetched per round trip when streaming traffic history
+STREAM_CHUNK_ROWS = 10_000
+
+
+def _fetch_columns(db: Session, query, dtypes: List, chunk_size: int = STREAM_CHUNK_ROWS) -> List[np.ndarray]:
+    """
+    Stream a column query in chunks into one numpy array per selected column
+    Rows are never materialized all at once; each chunk is converted as it arrives
+    """
+    result = db.execute(query.statement, execution_options={'yield_per': chunk_size})
+    chunks = [[] for _ in dtypes]
+    for partition in result.partitions():
+        for column_chunks, values, dtype in zip(chunks, zip(*partition), dtypes):
+            column_chunks.append(np.array(values, dtype=dtype))
+    
+    return [
+        np.concatenate(column_chunks) if column_chunks else np.empty(0, dtype=dtype)
+        for column_chunks, dtype in zip(chunks, dtypes)
+    ]
 
 
 # Pydantic models
@@ -52,7 +74,7 @@ class Anomaly(BaseModel):
 
 
 @router.post("/predict-speed", response_model=List[SpeedPrediction])
-async def predict_speed(request: PredictionRequest, db: Session = Depends(get_db)):
+def predict_speed(request: PredictionRequest, db: Session = Depends(get_db)):
     """
     Predict traffic speed for next N hours
     Uses Random Forest model trained on historical data
@@ -62,45 +84,54 @@ async def predict_speed(request: PredictionRequest, db: Session = Depends(get_db
         historical_data = None
         if request.road_segment_id:
             cutoff = datetime.now() - timedelta(days=30)
-            query = db.query(TrafficDynamics).filter(
+            query = db.query(
+                TrafficDynamics.average_speed,
+                TrafficDynamics.vehicle_count
+            ).filter(
                 TrafficDynamics.road_segment_id == request.road_segment_id,
                 TrafficDynamics.timestamp >= cutoff
-            ).all()
+            )
+            speeds, counts = _fetch_columns(db, query, [float, float])
             
-            if query:
-                historical_data = pd.DataFrame([
-                    {
-                        'timestamp': td.timestamp,
-                        'average_speed': td.average_speed,
-                        'vehicle_count': td.vehicle_count,
-                        'road_segment_id': td.road_segment_id
-                    }
-                    for td in query
-                ])
+            if len(speeds):
+                historical_data = pd.DataFrame({
+                    'average_speed': speeds,
+                    'vehicle_count': counts
+                })
         
-        # Generate predictions
-        predictions = []
+        # Reduce history once; every horizon step shares the same aggregates
+        hist_stats = predictor.historical_stats(historical_data)
+        
+        # Generate predictions for the whole horizon in one batch
         start_time = request.prediction_time or datetime.now()
+        times = [start_time + timedelta(hours=i) for i in range(request.horizon_hours)]
         
-        for i in range(request.horizon_hours):
-            prediction_time = start_time + timedelta(hours=i)
-            
-            result = predictor.predict_speed(
-                prediction_time,
-                request.road_segment_id or 1,
-                historical_data
-            )
-            
-            congestion = predictor.predict_congestion(result['predicted_speed'])
-            
-            predictions.append(SpeedPrediction(
+        result = predictor.predict_speed_batch(
+            times,
+            request.road_segment_id or 1,
+            hist_stats=hist_stats
+        )
+        
+        congestion_states = predictor.predict_congestion_batch(result['predicted_speed'])
+        
+        predictions = [
+            SpeedPrediction(
                 time=prediction_time,
-                predicted_speed=result['predicted_speed'],
-                confidence=result['confidence'],
-                congestion_state=congestion,
-                lower_bound=result['lower_bound'],
-                upper_bound=result['upper_bound']
-            ))
+                predicted_speed=speed,
+                confidence=confidence,
+                congestion_state=state,
+                lower_bound=lower,
+                upper_bound=upper
+            )
+            for prediction_time, speed, state, confidence, lower, upper in zip(
+                times,
+                result['predicted_speed'].tolist(),
+                congestion_states.tolist(),
+                result['confidence'].tolist(),
+                result['lower_bound'].tolist(),
+                result['upper_bound'].tolist()
+            )
+        ]
         
         return predictions
     
@@ -109,12 +140,12 @@ async def predict_speed(request: PredictionRequest, db: Session = Depends(get_db
 
 
 @router.post("/predict-congestion")
-async def predict_congestion(request: PredictionRequest, db: Session = Depends(get_db)):
+def predict_congestion(request: PredictionRequest, db: Session = Depends(get_db)):
     """
     Predict congestion levels for next N hours
     """
     try:
-        speed_predictions = await predict_speed(request, db)
+        speed_predictions = predict_speed(request, db)
         
         return {
             "predictions": [
@@ -136,7 +167,8 @@ async def predict_congestion(request: PredictionRequest, db: Session = Depends(g
 
 
 @router.get("/anomalies", response_model=List[Anomaly])
-async def detect_anomalies(
+def detect_anomalies(
+    background_tasks: BackgroundTasks,
     hours: int = Query(24, ge=1, le=168),
     severity: Optional[str] = None,
     db: Session = Depends(get_db)
@@ -148,49 +180,61 @@ async def detect_anomalies(
         # Get recent traffic data
         cutoff = datetime.now() - timedelta(hours=hours)
         query = db.query(
-            TrafficDynamics,
+            TrafficDynamics.timestamp,
+            func.coalesce(TrafficDynamics.average_speed, 0),
+            func.coalesce(TrafficDynamics.vehicle_count, 0),
+            TrafficDynamics.road_segment_id,
             RoadNetwork.name
         ).join(
             RoadNetwork,
             TrafficDynamics.road_segment_id == RoadNetwork.id
         ).filter(
             TrafficDynamics.timestamp >= cutoff
-        ).all()
+        )
+        timestamps, speeds, counts, segment_ids, names = _fetch_columns(
+            db, query, ['datetime64[us]', float, np.int64, np.int64, object]
+        )
         
-        if not query:
+        if not len(timestamps):
             return []
         
-        # Prepare data
-        current_data = pd.DataFrame([
-            {
-                'timestamp': td.timestamp,
-                'average_speed': td.average_speed or 0,
-                'vehicle_count': td.vehicle_count or 0,
-                'road_segment_id': td.road_segment_id,
-                'road_name': name
-            }
-            for td, name in query
-        ])
-        
-        # Get historical data for training anomaly detector
-        historical_cutoff = datetime.now() - timedelta(days=30)
-        historical_query = db.query(TrafficDynamics).filter(
-            TrafficDynamics.timestamp >= historical_cutoff,
-            TrafficDynamics.timestamp < cutoff
-        ).all()
+        # Plain column arrays; the detector does not need a DataFrame
+        current_data = {
+            'timestamp': timestamps,
+            'average_speed': speeds,
+            'vehicle_count': counts,
+            'road_segment_id': segment_ids
+        }
         
+        # Get historical data for training anomaly detector, unless a recent fit makes it unused
         historical_data = None
-        if historical_query:
-            historical_data = pd.DataFrame([
-                {
-                    'average_speed': td.average_speed or 0,
-                    'vehicle_count': td.vehicle_count or 0
+        if not predictor.anomaly_detector_fresh():
+            historical_cutoff = datetime.now() - timedelta(days=30)
+            historical_query = db.query(
+                func.coalesce(TrafficDynamics.average_speed, 0),
+                func.coalesce(TrafficDynamics.vehicle_count, 0)
+            ).filter(
+                TrafficDynamics.timestamp >= historical_cutoff,
+                TrafficDynamics.timestamp < cutoff
+            )
+            historical_speeds, historical_counts = _fetch_columns(db, historical_query, [float, np.int64])
+            
+            if len(historical_speeds):
+                historical_data = {
+                    'average_speed': historical_speeds,
+                    'vehicle_count': historical_counts
                 }
-                for td in historical_query
-            ])
         
         # Detect anomalies
+        fitted_at = predictor.anomaly_fitted_at
         detected = predictor.detect_anomalies(current_data, historical_data)
+        if predictor.anomaly_fitted_at != fitted_at:
+            # A new fit is shared with the other workers once the response has gone out
+            background_tasks.add_task(predictor.save_model, 'anomaly_detector')
+        
+        # Road names keyed by segment id (first reading per segment)
+        road_ids, first_rows = np.unique(segment_ids, return_index=True)
+        road_name_map = dict(zip(road_ids.tolist(), names[first_rows].tolist()))
         
         # Convert to response format
         anomalies = []
@@ -198,11 +242,6 @@ async def detect_anomalies(
             if severity and anom['severity'] != severity:
                 continue
             
-            # Find road info
-            road_info = current_data[
-                current_data['road_segment_id'] == anom['road_segment_id']
-            ].iloc[0]
-            
             description = f"{anom['anomaly_type'].replace('_', ' ').title()} detected"
             if anom['anomaly_type'] == 'severe_slowdown':
                 description += f" (speed: {anom['speed']} km/h)"
@@ -211,7 +250,7 @@ async def detect_anomalies(
             
             anomalies.append(Anomaly(
                 road_segment_id=anom['road_segment_id'],
-                road_name=road_info['road_name'],
+                road_name=road_name_map[anom['road_segment_id']],
                 anomaly_type=anom['anomaly_type'],
                 severity=anom['severity'],
                 anomaly_score=anom['anomaly_score'],
@@ -302,34 +341,40 @@ async def get_model_stats():
 @router.post("/train-model")
 async def train_model(
     background_tasks: BackgroundTasks,
-    days: int = Query(30, ge=7, le=180),
-    db: Session = Depends(get_db)
+    days: int = Query(30, ge=7, le=180)
 ):
     """
     Train/retrain AI models on historical data
     Runs in background to avoid blocking
     """
     def train_task():
+        # Runs after the response is sent, so it needs its own session
+        db = SessionLocal()
         try:
             # Get historical data
             cutoff = datetime.now() - timedelta(days=days)
-            query = db.query(TrafficDynamics).filter(
+            query = db.query(
+                TrafficDynamics.timestamp,
+                func.coalesce(TrafficDynamics.average_speed, 40.0),
+                func.coalesce(TrafficDynamics.vehicle_count, 0),
+                TrafficDynamics.road_segment_id
+            ).filter(
                 TrafficDynamics.timestamp >= cutoff
-            ).all()
+            )
+            timestamps, speeds, counts, segment_ids = _fetch_columns(
+                db, query, ['datetime64[us]', float, np.int64, float]
+            )
             
-            if len(query) < 50:
-                print(f"Insufficient data for training: {len(query)} samples")
+            if len(timestamps) < 50:
+                print(f"Insufficient data for training: {len(timestamps)} samples")
                 return
             
-            training_data = pd.DataFrame([
-                {
-                    'timestamp': td.timestamp,
-                    'average_speed': td.average_speed or 40.0,
-                    'vehicle_count': td.vehicle_count or 0,
-                    'road_segment_id': td.road_segment_id
-                }
-                for td in query
-            ])
+            training_data = pd.DataFrame({
+                'timestamp': timestamps,
+                'average_speed': speeds,
+                'vehicle_count': counts,
+                'road_segment_id': segment_ids
+            })
             
             # Train speed prediction model
             accuracy = predictor.train_speed_model(training_data)
@@ -337,6 +382,8 @@ async def train_model(
         
         except Exception as e:
             print(f"Training failed: {str(e)}")
+        finally:
+            db.close()
     
     background_tasks.add_task(train_task)
     
@@ -3,72 +3,88 @@ Analytics Router
 Provides traffic analytics, historical trends, and statistical insights
 """
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, Integer
+from sqlalchemy import func, and_, bindparam, case, select
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
-import random
+import csv
+import io
+import threading
+import time
+import numpy as np
 
-from Traffic_Backend.db_config import get_db
+from Traffic_Backend.db_config import get_db, SessionLocal
 from Traffic_Backend.models import TrafficDynamics, RoadNetwork
 
-router = APIRouter(prefix="/analytics", tags=["analytics"])
+router = APIRouter(prefix="/analytics", tags=["analytics"], default_response_class=ORJSONResponse)
 
 
 # Mock data generators for when database is empty
+_rng = np.random.default_rng()
+
+
+def _hour_bands(hour: np.ndarray):
+    """Boolean masks for rush hours and night hours"""
+    rush = ((hour >= 7) & (hour <= 9)) | ((hour >= 17) & (hour <= 19))
+    night = (hour >= 22) | (hour <= 5)
+    return rush, night
+
+
 def _generate_mock_traffic_trends(hours: int) -> List:
     """Generate mock traffic trend data"""
-    trends = []
     now = datetime.now()
-    for i in range(min(hours, 24)):  # Generate hourly data
-        timestamp = now - timedelta(hours=i)
-        # Simulate rush hour patterns
-        hour = timestamp.hour
-        base_speed = 40
-        if 7 <= hour <= 9 or 17 <= hour <= 19:  # Rush hours
-            avg_speed = base_speed - random.randint(10, 20)
-            vehicle_count = random.randint(80, 150)
-            congestion = "high"
-        elif 22 <= hour or hour <= 5:  # Night
-            avg_speed = base_speed + random.randint(10, 20)
-            vehicle_count = random.randint(10, 30)
-            congestion = "low"
-        else:  # Normal hours
-            avg_speed = base_speed + random.randint(-5, 10)
-            vehicle_count = random.randint(40, 80)
-            congestion = "medium"
-        
-        trends.append({
-            "timestamp": timestamp,
-            "avg_speed": round(avg_speed + random.uniform(-3, 3), 2),
-            "vehicle_count": vehicle_count,
-            "congestion_state": congestion
-        })
-    return list(reversed(trends))
+    n = min(hours, 24)  # Generate hourly data
+    hours_ago = np.arange(n - 1, -1, -1)  # Oldest first
+    # Simulate rush hour patterns
+    rush, night = _hour_bands((now.hour - hours_ago) % 24)
+    bands = [rush, night]
+    base_speed = 40
+    avg_speed = base_speed + np.select(
+        bands,
+        [-_rng.integers(10, 21, n), _rng.integers(10, 21, n)],
+        _rng.integers(-5, 11, n)
+    ) + _rng.uniform(-3, 3, n)
+    vehicle_count = np.select(
+        bands,
+        [_rng.integers(80, 151, n), _rng.integers(10, 31, n)],
+        _rng.integers(40, 81, n)
+    )
+    congestion = np.select(bands, ["high", "low"], "medium")
+    
+    return [
+        {
+            "timestamp": now - timedelta(hours=ago),
+            "avg_speed": speed,
+            "vehicle_count": count,
+            "congestion_state": state
+        }
+        for ago, speed, count, state in zip(
+            hours_ago.tolist(), avg_speed.round(2).tolist(), vehicle_count.tolist(), congestion.tolist()
+        )
+    ]
 
 
 def _generate_mock_speed_profiles() -> List:
     """Generate mock 24-hour speed profiles"""
-    profiles = []
-    for hour in range(24):
-        if 7 <= hour <= 9 or 17 <= hour <= 19:  # Rush hours
-            avg_speed = random.uniform(25, 35)
-            vehicle_count = random.randint(100, 150)
-        elif 22 <= hour or hour <= 5:  # Night
-            avg_speed = random.uniform(55, 65)
-            vehicle_count = random.randint(10, 25)
-        else:  # Normal hours
-            avg_speed = random.uniform(40, 50)
-            vehicle_count = random.randint(50, 80)
-        
-        profiles.append({
-            "hour": hour,
-            "avg_speed": round(avg_speed, 2),
-            "vehicle_count": vehicle_count,
-            "sample_size": random.randint(20, 50)
-        })
-    return profiles
+    hour = np.arange(24)
+    bands = list(_hour_bands(hour))  # Rush hours, night, otherwise normal hours
+    avg_speed = _rng.uniform(np.select(bands, [25, 55], 40), np.select(bands, [35, 65], 50))
+    vehicle_count = _rng.integers(np.select(bands, [100, 10], 50), np.select(bands, [151, 26], 81))
+    sample_size = _rng.integers(20, 51, 24)
+    
+    return [
+        {
+            "hour": h,
+            "avg_speed": speed,
+            "vehicle_count": count,
+            "sample_size": samples
+        }
+        for h, speed, count, samples in zip(
+            hour.tolist(), avg_speed.round(2).tolist(), vehicle_count.tolist(), sample_size.tolist()
+        )
+    ]
 
 
 # Pydantic models
@@ -100,6 +116,64 @@ class AnalyticsSummary(BaseModel):
     peak_hour: Optional[int]
 
 
+def _cutoff(**window) -> datetime:
+    """
+    Start of a look-back window, truncated to the minute
+    Repeat requests within a minute share the same bound parameters
+    Traffic timestamps are stored in server local time, so this stays on datetime.now()
+    """
+    return datetime.now().replace(second=0, microsecond=0) - timedelta(**window)
+
+
+# Trend and profile statements are built once; handlers only bind the window (and segment)
+def _window_criteria(by_segment: bool) -> List:
+    criteria = [TrafficDynamics.timestamp >= bindparam('cutoff')]
+    if by_segment:
+        criteria.append(TrafficDynamics.road_segment_id == bindparam('road_segment_id'))
+    return criteria
+
+
+def _trends_statement(by_segment: bool):
+    # Rounded and defaulted in SQL so rows map straight onto the response.
+    # Hourly buckets are date + the indexed hour_of_day column, both portable across MySQL and SQLite;
+    # each bucket reports its first reading's timestamp, so the selected columns are all grouped or aggregated
+    first_reading = func.min(TrafficDynamics.timestamp).label('timestamp')
+    return select(
+        first_reading,
+        func.coalesce(func.round(func.avg(TrafficDynamics.average_speed), 2), 0).label('avg_speed'),
+        func.coalesce(func.sum(TrafficDynamics.vehicle_count), 0).label('vehicle_count'),
+        TrafficDynamics.congestion_state
+    ).where(
+        *_window_criteria(by_segment)
+    ).group_by(
+        func.date(TrafficDynamics.timestamp),
+        TrafficDynamics.hour_of_day,
+        TrafficDynamics.congestion_state
+    ).order_by(first_reading)
+
+
+def _profiles_statement(by_segment: bool):
+    return select(
+        TrafficDynamics.hour_of_day.label('hour'),
+        func.avg(TrafficDynamics.average_speed).label('avg_speed'),
+        func.avg(TrafficDynamics.vehicle_count).label('vehicle_count'),
+        func.count(TrafficDynamics.id).label('sample_size')
+    ).where(
+        *_window_criteria(by_segment)
+    ).group_by(TrafficDynamics.hour_of_day).order_by(TrafficDynamics.hour_of_day)
+
+
+_TRENDS_STMT = {by_segment: _trends_statement(by_segment) for by_segment in (False, True)}
+_PROFILES_STMT = {by_segment: _profiles_statement(by_segment) for by_segment in (False, True)}
+
+
+def _window_params(cutoff: datetime, road_segment_id: Optional[int]) -> Dict:
+    params = {'cutoff': cutoff}
+    if road_segment_id:
+        params['road_segment_id'] = road_segment_id
+    return params
+
+
 @router.get("/traffic-trends")
 def get_traffic_trends(
     hours: int = Query(24, ge=1, le=168, description="Hours to look back (1-168)"),
@@ -107,38 +181,14 @@ def get_traffic_trends(
     db: Session = Depends(get_db)
 ):
     """Get historical traffic trends for the last N hours"""
-    cutoff = datetime.now() - timedelta(hours=hours)
-    
-    query = db.query(
-        TrafficDynamics.timestamp,
-        func.avg(TrafficDynamics.average_speed).label('avg_speed'),
-        func.sum(TrafficDynamics.vehicle_count).label('vehicle_count'),
-        TrafficDynamics.congestion_state
-    ).filter(TrafficDynamics.timestamp >= cutoff)
-    
-    if road_segment_id:
-        query = query.filter(TrafficDynamics.road_segment_id == road_segment_id)
-    
-    query = query.group_by(
-        func.strftime('%Y-%m-%d %H:00:00', TrafficDynamics.timestamp),
-        TrafficDynamics.congestion_state
-    ).order_by(TrafficDynamics.timestamp)
-    
-    results = query.all()
+    params = _window_params(_cutoff(hours=hours), road_segment_id)
+    results = db.execute(_TRENDS_STMT[bool(road_segment_id)], params).mappings().all()
     
     # If no data, return mock data
     if not results or len(results) == 0:
         return _generate_mock_traffic_trends(hours)
     
-    return [
-        {
-            "timestamp": row.timestamp,
-            "avg_speed": round(row.avg_speed, 2),
-            "vehicle_count": row.vehicle_count or 0,
-            "congestion_state": row.congestion_state
-        }
-        for row in results
-    ]
+    return [dict(row) for row in results]
 
 
 @router.get("/speed-profiles")
@@ -148,21 +198,8 @@ def get_speed_profiles(
     db: Session = Depends(get_db)
 ):
     """Get average speed profiles by hour of day"""
-    cutoff = datetime.now() - timedelta(days=days)
-    
-    query = db.query(
-        func.cast(func.strftime('%H', TrafficDynamics.timestamp), Integer).label('hour'),
-        func.avg(TrafficDynamics.average_speed).label('avg_speed'),
-        func.avg(TrafficDynamics.vehicle_count).label('vehicle_count'),
-        func.count(TrafficDynamics.id).label('sample_size')
-    ).filter(TrafficDynamics.timestamp >= cutoff)
-    
-    if road_segment_id:
-        query = query.filter(TrafficDynamics.road_segment_id == road_segment_id)
-    
-    query = query.group_by('hour').order_by('hour')
-    
-    results = query.all()
+    params = _window_params(_cutoff(days=days), road_segment_id)
+    results = db.execute(_PROFILES_STMT[bool(road_segment_id)], params).all()
     
     # If no data, return mock data
     if not results or len(results) == 0:
@@ -179,112 +216,132 @@ def get_speed_profiles(
     ]
 
 
+# A map view never needs more than the top few hundred segments
+HEATMAP_MAX_SEGMENTS = 500
+
+
+def _capped_ratio(value, scale: float):
+    """min(value / scale, 1) with NULL treated as 0"""
+    ratio = func.coalesce(value, 0) / scale
+    return case((ratio > 1.0, 1.0), else_=ratio)
+
+
+# Congestion score calculation:
+# Higher vehicle count = more congestion
+# Lower speed = more congestion
+# Normalized to 0-100 scale
+_CONGESTION_SCORE = (
+    _capped_ratio(func.avg(TrafficDynamics.vehicle_count), 50.0) * 0.6
+    + (1 - _capped_ratio(func.avg(TrafficDynamics.average_speed), 80.0)) * 0.4
+) * 100
+
+
 @router.get("/congestion-heatmap", response_model=List[CongestionHeatmap])
 def get_congestion_heatmap(
     hours: int = Query(24, ge=1, le=168, description="Hours to analyze (1-168)"),
     min_congestion: float = Query(0, ge=0, le=100, description="Minimum congestion score"),
+    limit: int = Query(HEATMAP_MAX_SEGMENTS, ge=1, le=HEATMAP_MAX_SEGMENTS, description="Most congested segments to return"),
     db: Session = Depends(get_db)
 ):
     """Get congestion heatmap data for map visualization"""
-    cutoff = datetime.now() - timedelta(hours=hours)
+    cutoff = _cutoff(hours=hours)
     
-    # Calculate congestion score based on vehicle count and speed
     # Note: RoadNetwork doesn't have centroid_lat/lon, using dummy values for now
     query = db.query(
         TrafficDynamics.road_segment_id,
         RoadNetwork.name,
         func.avg(TrafficDynamics.vehicle_count).label('avg_vehicle_count'),
-        func.avg(TrafficDynamics.average_speed).label('avg_speed')
+        _CONGESTION_SCORE.label('congestion_score')
     ).join(
         RoadNetwork, TrafficDynamics.road_segment_id == RoadNetwork.id
     ).filter(
         TrafficDynamics.timestamp >= cutoff
     ).group_by(
         TrafficDynamics.road_segment_id
-    ).all()
-    
-    heatmap_data = []
-    for row in query:
-        # Congestion score calculation:
-        # Higher vehicle count = more congestion
-        # Lower speed = more congestion
-        # Normalized to 0-100 scale
-        vehicle_factor = min((row.avg_vehicle_count or 0) / 50, 1.0)  # Normalize to 0-1
-        speed_factor = 1 - min((row.avg_speed or 0) / 80, 1.0)  # Invert and normalize
-        congestion_score = ((vehicle_factor * 0.6) + (speed_factor * 0.4)) * 100
-        
-        if congestion_score >= min_congestion:
-            heatmap_data.append(
-                CongestionHeatmap(
-                    road_segment_id=row.road_segment_id,
-                    road_name=row.name,
-                    lat=23.0225,  # Default Ahmedabad center (will use real data later)
-                    lon=72.5714,
-                    congestion_score=round(congestion_score, 2),
-                    avg_vehicle_count=int(row.avg_vehicle_count or 0)
-                )
-            )
+    ).having(
+        _CONGESTION_SCORE >= min_congestion
+    ).order_by(
+        _CONGESTION_SCORE.desc(), TrafficDynamics.road_segment_id
+    ).limit(limit).all()
     
-    # Sort by congestion score descending
-    heatmap_data.sort(key=lambda x: x.congestion_score, reverse=True)
+    heatmap_data = [
+        CongestionHeatmap(
+            road_segment_id=row.road_segment_id,
+            road_name=row.name,
+            lat=23.0225,  # Default Ahmedabad center (will use real data later)
+            lon=72.5714,
+            congestion_score=round(row.congestion_score, 2),
+            avg_vehicle_count=int(row.avg_vehicle_count or 0)
+        )
+        for row in query
+    ]
     
     return heatmap_data
 
 
-@router.get("/summary")
-def get_analytics_summary(db: Session = Depends(get_db)):
-    """Get overall analytics summary"""
-    total_segments = db.query(func.count(RoadNetwork.id)).scalar() or 0
-    total_records = db.query(func.count(TrafficDynamics.id)).scalar() or 0
-    avg_speed = db.query(func.avg(TrafficDynamics.average_speed)).scalar()
-    
-    # If no data, return mock summary
-    if total_records == 0:
-        return {
-            "total_road_segments": 45,
-            "total_traffic_records": 1250,
-            "avg_speed_kmh": 42.5,
-            "most_congested_segment": "S.G. Highway",
-            "peak_hour": 18
-        }
-    
+# Every summary figure is a scalar subquery, so the endpoint makes a single round trip
+_SUMMARY_QUERY = select(
+    select(func.count(RoadNetwork.id)).scalar_subquery().label('total_segments'),
+    select(func.count(TrafficDynamics.id)).scalar_subquery().label('total_records'),
+    select(func.avg(TrafficDynamics.average_speed)).scalar_subquery().label('avg_speed'),
     # Most congested segment (highest vehicle count)
-    most_congested = db.query(
-        RoadNetwork.name,
-        func.avg(TrafficDynamics.vehicle_count).label('avg_count')
-    ).join(
+    select(RoadNetwork.name).join(
         TrafficDynamics, RoadNetwork.id == TrafficDynamics.road_segment_id
     ).group_by(
         RoadNetwork.id
     ).order_by(
         func.avg(TrafficDynamics.vehicle_count).desc()
-    ).first()
-    
+    ).limit(1).scalar_subquery().label('most_congested'),
     # Peak hour (most traffic)
-    peak_hour_result = db.query(
-        func.cast(func.strftime('%H', TrafficDynamics.timestamp), int).label('hour'),
-        func.sum(TrafficDynamics.vehicle_count).label('total_count')
-    ).group_by('hour').order_by(func.sum(TrafficDynamics.vehicle_count).desc()).first()
-    
-    return {
-        "total_road_segments": total_segments,
-        "total_traffic_records": total_records,
-        "avg_speed_kmh": round(avg_speed, 2) if avg_speed else 0,
-        "most_congested_segment": most_congested.name if most_congested else None,
-        "peak_hour": peak_hour_result.hour if peak_hour_result else None
-    }
+    select(TrafficDynamics.hour_of_day).group_by(TrafficDynamics.hour_of_day).order_by(
+        func.sum(TrafficDynamics.vehicle_count).desc()
+    ).limit(1).scalar_subquery().label('peak_hour')
+)
 
 
-@router.get("/export/traffic-data")
-def export_traffic_data(
-    hours: int = Query(24, ge=1, le=168),
-    format: str = Query("csv", regex="^(csv|json)$"),
-    db: Session = Depends(get_db)
-):
-    """Export traffic data in CSV or JSON format"""
-    cutoff = datetime.now() - timedelta(hours=hours)
-    
-    query = db.query(
+# The summary moves on a minute scale, so it is served from memory between refreshes
+SUMMARY_TTL_SECONDS = 60
+_summary_cache: Dict = {}
+_summary_lock = threading.Lock()
+
+
+@router.get("/summary")
+def get_analytics_summary(db: Session = Depends(get_db)):
+    """Get overall analytics summary"""
+    with _summary_lock:
+        if _summary_cache and time.monotonic() < _summary_cache['expires_at']:
+            return _summary_cache['value']
+        
+        summary = db.execute(_SUMMARY_QUERY).one()
+        
+        # If no data, return mock summary (not cached, so real data shows up as soon as it lands)
+        if not summary.total_records:
+            return {
+                "total_road_segments": 45,
+                "total_traffic_records": 1250,
+                "avg_speed_kmh": 42.5,
+                "most_congested_segment": "S.G. Highway",
+                "peak_hour": 18
+            }
+        
+        value = {
+            "total_road_segments": summary.total_segments or 0,
+            "total_traffic_records": summary.total_records,
+            "avg_speed_kmh": round(summary.avg_speed, 2) if summary.avg_speed else 0,
+            "most_congested_segment": summary.most_congested,
+            "peak_hour": summary.peak_hour
+        }
+        _summary_cache['value'] = value
+        _summary_cache['expires_at'] = time.monotonic() + SUMMARY_TTL_SECONDS
+        return value
+
+
+# Rows fetched per round trip while streaming an export
+EXPORT_CHUNK_ROWS = 5_000
+
+
+def _export_query(cutoff: datetime):
+    return select(
         TrafficDynamics.timestamp,
         RoadNetwork.name,
         TrafficDynamics.vehicle_count,
@@ -293,36 +350,64 @@ def export_traffic_data(
         TrafficDynamics.flow_entropy
     ).join(
         RoadNetwork, TrafficDynamics.road_segment_id == RoadNetwork.id
-    ).filter(
+    ).where(
         TrafficDynamics.timestamp >= cutoff
-    ).order_by(TrafficDynamics.timestamp).all()
+    ).order_by(TrafficDynamics.timestamp)
+
+
+def _stream_traffic_csv(cutoff: datetime):
+    """
+    Yield the CSV export one chunk of rows at a time
+    Uses its own session because the response body is produced after the endpoint returns
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    
+    def drain() -> str:
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+    
+    writer.writerow(("timestamp", "road_name", "vehicle_count", "avg_speed_kmh", "congestion_state", "flow_entropy"))
+    yield drain()
+    db = SessionLocal()
+    try:
+        result = db.execute(_export_query(cutoff), execution_options={'yield_per': EXPORT_CHUNK_ROWS})
+        for rows in result.partitions():
+            writer.writerows(rows)
+            yield drain()
+    finally:
+        db.close()
+
+
+@router.get("/export/traffic-data")
+def export_traffic_data(
+    hours: int = Query(24, ge=1, le=168),
+    format: str = Query("csv", regex="^(csv|json)$"),
+    db: Session = Depends(get_db)
+):
+    """Export traffic data in CSV or JSON format"""
+    cutoff = _cutoff(hours=hours)
     
     if format == "csv":
-        # Generate CSV
-        csv_lines = ["timestamp,road_name,vehicle_count,avg_speed_kmh,congestion_state,flow_entropy"]
-        for row in query:
-            csv_lines.append(
-                f"{row.timestamp},{row.name},{row.vehicle_count},{row.average_speed},"
-                f"{row.congestion_state},{row.flow_entropy}"
-            )
-        
-        from fastapi.responses import Response
-        return Response(
-            content="\n".join(csv_lines),
+        # Stream the CSV so memory stays flat regardless of the time window
+        return StreamingResponse(
+            _stream_traffic_csv(cutoff),
             media_type="text/csv",
             headers={"Content-Disposition": f"attachment; filename=traffic_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
         )
     else:
-        # JSON format
+        # JSON format; orjson encodes the datetimes directly, so skip FastAPI's encoder pass
         data = [
             {
-                "timestamp": row.timestamp.isoformat(),
+                "timestamp": row.timestamp,
                 "road_name": row.name,
                 "vehicle_count": row.vehicle_count,
                 "avg_speed_kmh": row.average_speed,
                 "congestion_state": row.congestion_state,
                 "flow_entropy": row.flow_entropy
             }
-            for row in query
+            for row in db.execute(_export_query(cutoff))
         ]
-        return {"data": data, "total_records": len(data)}
+        return ORJSONResponse({"data": data, "total_records": len(data)})
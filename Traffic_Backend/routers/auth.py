@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
@@ -7,7 +8,7 @@ from typing import Optional
 from Traffic_Backend.auth import authenticate_user_db, create_access_token, create_user, get_db
 from Traffic_Backend.models import User as UserModel
 
-router = APIRouter(prefix="", tags=["auth"])
+router = APIRouter(prefix="", tags=["auth"], default_response_class=ORJSONResponse)
 
 
 class Token(BaseModel):
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 from sqlalchemy.orm import Session
+from sqlalchemy import func
+import orjson
 import Traffic_Backend.models as models
 from Traffic_Backend.db_config import SessionLocal
 from Traffic_Backend.auth import require_role
 
-router = APIRouter(prefix="/notifications", tags=["notifications"])
+router = APIRouter(prefix="/notifications", tags=["notifications"], default_response_class=ORJSONResponse)
 
 
 def get_db():
@@ -39,6 +42,9 @@ TEMPLATES = {
     "public_update": "Construction update for project {project_id}: {message}"
 }
 
+# Templates never change at runtime, so the response body is encoded once
+_TEMPLATES_JSON = orjson.dumps({"templates": TEMPLATES})
+
 
 @router.post("/send", dependencies=[Depends(require_role("admin"))])
 def send_notification(payload: NotificationPayload, db: Session = Depends(get_db)):
@@ -58,10 +64,19 @@ def send_notification(payload: NotificationPayload, db: Session = Depends(get_db
 
 
 @router.get("/log")
-def get_log(limit: int = 100, db: Session = Depends(get_db)):
-    """Get notification log from DB."""
-    entries = db.query(models.Notification).order_by(models.Notification.timestamp.desc()).limit(limit).all()
-    return {"total": len(entries), "entries": [
+def get_log(limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)):
+    """Get notification log from DB; total counts every notification, not just this page."""
+    total = db.query(func.count(models.Notification.id)).scalar()
+    # Only the logged columns are selected, so no ORM objects (or lazy loads) are built per row
+    entries = db.query(
+        models.Notification.id,
+        models.Notification.project_id,
+        models.Notification.recipient_type,
+        models.Notification.message,
+        models.Notification.timestamp,
+        models.Notification.delivery_status
+    ).order_by(models.Notification.timestamp.desc()).limit(limit).all()
+    return {"total": total, "entries": [
         {"id": e.id, "project_id": e.project_id, "recipient_type": e.recipient_type, "message": e.message, "timestamp": e.timestamp, "status": e.delivery_status} for e in entries
     ]}
 
@@ -69,5 +84,5 @@ def get_log(limit: int = 100, db: Session = Depends(get_db)):
 @router.get("/templates")
 def get_templates():
     """Get available notification templates."""
-    return {"templates": TEMPLATES}
+    return Response(content=_TEMPLATES_JSON, media_type="application/json")
 
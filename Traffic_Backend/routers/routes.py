@@ -1,19 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict
-from shapely.geometry import LineString, Point
+from typing import Optional, List, Dict, Tuple
 import Traffic_Backend.models as models
 from Traffic_Backend.db_config import SessionLocal
 from Traffic_Backend.auth import require_role
+from Traffic_Backend.graph_index import ensure_graph_index, edge_lengths_along
 from sqlalchemy.orm import Session
+from sqlalchemy import func
 import networkx as nx
-import random
+import numpy as np
+from itertools import islice
+import heapq
+from functools import lru_cache
 import os
 import httpx
 import json
 from urllib.parse import quote
 
-router = APIRouter(prefix="/routes", tags=["routes"])
+router = APIRouter(prefix="/routes", tags=["routes"], default_response_class=ORJSONResponse)
 
 
 def get_db():
@@ -111,41 +116,121 @@ class RecommendationResponse(BaseModel):
     recommendation_justification: str
 
 
+_rng = np.random.default_rng()
+
+
+def _polyline_length(coords: List[List[float]]) -> float:
+    """Planar length in degrees of a [[lon, lat], ...] polyline."""
+    steps = np.diff(np.asarray(coords, dtype=np.float64), axis=0)
+    return float(np.hypot(steps[:, 0], steps[:, 1]).sum())
+
+
 def _find_nearest_node(point: tuple, graph: nx.DiGraph) -> Optional[tuple]:
     """Find nearest graph node to a (lon, lat) coordinate."""
-    if not graph or len(graph.nodes()) == 0:
+    if graph is None or graph.number_of_nodes() == 0:
         return None
-    min_dist = float('inf')
-    nearest = None
-    for node in graph.nodes():
-        # node is (lon_rounded, lat_rounded)
-        dist = ((point[0] - node[0]) ** 2 + (point[1] - node[1]) ** 2) ** 0.5
-        if dist < min_dist:
-            min_dist = dist
-            nearest = node
-    return nearest
-
-
-def _find_alternatives(start_node: tuple, end_node: tuple, graph: nx.DiGraph, k: int = 3) -> List[List[tuple]]:
-    """Find k shortest paths between start and end nodes."""
-    if not graph or start_node not in graph.nodes() or end_node not in graph.nodes():
-        return []
-    try:
-        # Get k shortest simple paths
-        paths = list(nx.all_simple_paths(graph, start_node, end_node, cutoff=20))
-        # Sort by path length and return top k
-        paths.sort(key=lambda p: sum(graph[p[i]][p[i+1]].get('length', 0) for i in range(len(p)-1)))
-        return paths[:k]
-    except (nx.NetworkXNoPath, nx.NodeNotFound):
+    # Built with the graph at load time; rebuilt here only if the graph has changed since
+    ensure_graph_index(graph)
+    kdtree = graph.graph['kdtree']
+    if kdtree is not None:
+        _, idx = kdtree.query(point, k=1)
+        return graph.graph['node_list'][idx]
+    # Without scipy, scan the cached coordinate array in one vectorized pass
+    coords = graph.graph['node_coords']
+    dx = coords[:, 0] - point[0]
+    dy = coords[:, 1] - point[1]
+    return graph.graph['node_list'][int(np.argmin(dx * dx + dy * dy))]
+
+
+# Above this many nodes Yen's algorithm is replaced by the count-pruned search below
+YEN_MAX_NODES = 100_000
+
+
+def _k_shortest_by_count(graph: nx.DiGraph, start_node: tuple, end_node: tuple, k: int = 3) -> List[List[tuple]]:
+    """
+    Up to k short loopless paths from a single Dijkstra-style search in which every node is
+    settled at most k times. Much cheaper than Yen's on large road graphs, but a heuristic:
+    the pruning can skip some of the true k shortest simple paths (the first one is always found).
+
+    Each heap entry is a label (node, parent label), so a push costs O(1) whatever the path length.
+    Only immediate U-turns are refused while searching; a walk that reaches the target is rebuilt
+    from its parents there and dropped if it repeats a node.
+    """
+    label_nodes = [start_node]
+    label_parents = [-1]
+    settled = {}
+    paths = []
+    heap = [(0.0, 0)]
+    while heap and len(paths) < k:
+        cost, label = heapq.heappop(heap)
+        node = label_nodes[label]
+        if settled.get(node, 0) >= k:
+            continue
+        if node == end_node:
+            path = []
+            while label >= 0:
+                path.append(label_nodes[label])
+                label = label_parents[label]
+            if len(set(path)) == len(path):
+                settled[node] = settled.get(node, 0) + 1
+                paths.append(path[::-1])
+            continue
+        settled[node] = settled.get(node, 0) + 1
+        parent = label_parents[label]
+        previous = label_nodes[parent] if parent >= 0 else None
+        for neighbour, data in graph[node].items():
+            if neighbour != previous and settled.get(neighbour, 0) < k:
+                label_nodes.append(neighbour)
+                label_parents.append(label)
+                heapq.heappush(heap, (cost + data.get('length', 0), len(label_nodes) - 1))
+    return paths
+
+
+def _find_alternatives(start_node: tuple, end_node: tuple, graph: nx.DiGraph, k: int = 3) -> List[Tuple[List[tuple], float]]:
+    """Find k shortest paths between start and end nodes, each paired with its total length."""
+    if graph is None or start_node not in graph or end_node not in graph:
         return []
+    if graph.number_of_nodes() > YEN_MAX_NODES:
+        paths = _k_shortest_by_count(graph, start_node, end_node, k)
+        if len(paths) < k:
+            # The pruned search can come up short; make sure a connected pair still gets its shortest path
+            try:
+                shortest = nx.shortest_path(graph, start_node, end_node, weight='length')
+            except nx.NetworkXNoPath:
+                shortest = None
+            if shortest is not None and shortest not in paths:
+                paths.insert(0, shortest)
+    else:
+        try:
+            # Yen's algorithm yields simple paths in order of total length, so only k are built
+            paths = list(islice(nx.shortest_simple_paths(graph, start_node, end_node, weight='length'), k))
+        except (nx.NetworkXNoPath, nx.NodeNotFound):
+            return []
+    return [(path, _path_length(path, graph)) for path in paths]
+
+
+@lru_cache(maxsize=4096)
+def _cached_alternatives(graph: nx.DiGraph, start_node: tuple, end_node: tuple, k: int = 3) -> Tuple[Tuple[Tuple[tuple, ...], float], ...]:
+    """
+    Memoized _find_alternatives keyed on the graph and the snapped node pair.
+    Many request coordinates snap to the same nodes; cleared by clear_path_cache when a new network loads.
+    """
+    return tuple((tuple(path), length) for path, length in _find_alternatives(start_node, end_node, graph, k))
+
+
+def clear_path_cache() -> None:
+    """Drop memoized alternatives (and the graph references they hold)."""
+    _cached_alternatives.cache_clear()
 
 
-def _score_alternative(path: List[tuple], graph: nx.DiGraph, db: Session) -> float:
-    """Score an alternative route based on length and traffic."""
-    if len(path) < 2:
-        return 0.0
-    # Calculate path length
-    path_length = sum(graph[path[i]][path[i+1]].get('length', 0) for i in range(len(path)-1))
+def _path_length(path: List[tuple], graph: nx.DiGraph) -> float:
+    """Sum of edge lengths along a path."""
+    ensure_graph_index(graph)
+    return float(edge_lengths_along(graph, path).sum())
+
+
+def _score_alternative(path_length: float) -> float:
+    """Score an alternative route from its total edge length."""
     # For now, score is inverse of length (shorter is better)
     # Future: incorporate traffic data from DB
     score = 1.0 / (1.0 + path_length)
@@ -167,9 +252,7 @@ def analyze_route(payload: RouteAnalyzeRequest, db: Session = Depends(get_db)):
     if len(coords) < 2:
         raise HTTPException(status_code=400, detail="At least two coordinates required")
 
-    # Calculate distance using Shapely
-    ls = LineString([(c[0], c[1]) for c in coords])
-    length_deg = ls.length
+    length_deg = _polyline_length(coords)
     # Approximate conversion: 1 degree ~ 111 km (at equator)
     distance_km = round(length_deg * 111, 2)
     
@@ -227,19 +310,27 @@ def _estimate_road_properties(distance_km: float, coords: List[List[float]]) ->
         )
 
 
+# Base vehicles per km per hour based on road type
+_BASE_DENSITY = {
+    "Highway": 800,
+    "Main Road": 600,
+    "Urban Road": 400,
+    "Local Street": 200
+}
+
+# Average speed based on road type
+_AVG_SPEED_MAP = {
+    "Highway": 80.0,
+    "Main Road": 50.0,
+    "Urban Road": 35.0,
+    "Local Street": 20.0
+}
+
+
 def _estimate_traffic_counts(distance_km: float, road_props: RoadProperties) -> TrafficCounts:
     """Estimate traffic vehicle counts based on road type and distance."""
     # Mock estimation - in production, query traffic sensors/historical data
-    
-    # Base vehicles per km per hour based on road type
-    base_density = {
-        "Highway": 800,
-        "Main Road": 600,
-        "Urban Road": 400,
-        "Local Street": 200
-    }
-    
-    base = base_density.get(road_props.road_type, 400)
+    base = _BASE_DENSITY.get(road_props.road_type, 400)
     total = int(base * distance_km)
     
     # Distribution percentages (typical for Indian cities)
@@ -247,36 +338,26 @@ def _estimate_traffic_counts(distance_km: float, road_props: RoadProperties) ->
     four_wheeler = int(total * 0.40)  # 40% cars
     heavy = int(total * 0.15)  # 15% buses/trucks
     
-    # Average speed based on road type
-    avg_speed_map = {
-        "Highway": 80.0,
-        "Main Road": 50.0,
-        "Urban Road": 35.0,
-        "Local Street": 20.0
-    }
-    
     return TrafficCounts(
         total_vehicles=total,
         two_wheeler=two_wheeler,
         four_wheeler=four_wheeler,
         heavy_vehicle=heavy,
-        avg_speed_kmh=avg_speed_map.get(road_props.road_type, 35.0)
+        avg_speed_kmh=_AVG_SPEED_MAP.get(road_props.road_type, 35.0)
     )
 
 
 @router.get("/{route_id}/metrics")
 def route_metrics(route_id: int, db: Session = Depends(get_db)):
-    segment = db.query(models.RoadNetwork).filter(models.RoadNetwork.id == route_id).first()
+    segment = db.get(models.RoadNetwork, route_id)
     if not segment:
         raise HTTPException(status_code=404, detail="Route segment not found")
 
-    dynamics = db.query(models.TrafficDynamics).filter(models.TrafficDynamics.road_segment_id == route_id).all()
-    vehicle_count = sum((d.vehicle_count or 0) for d in dynamics)
-    avg_speed = None
-    if dynamics:
-        speeds = [d.average_speed for d in dynamics if d.average_speed is not None]
-        if speeds:
-            avg_speed = sum(speeds) / len(speeds)
+    # Aggregate in the database; AVG skips NULL speeds and is NULL when there are none
+    vehicle_count, avg_speed = db.query(
+        func.coalesce(func.sum(models.TrafficDynamics.vehicle_count), 0),
+        func.avg(models.TrafficDynamics.average_speed)
+    ).filter(models.TrafficDynamics.road_segment_id == route_id).one()
 
     return {
         "route_id": route_id,
@@ -287,65 +368,42 @@ def route_metrics(route_id: int, db: Session = Depends(get_db)):
     }
 
 
-@router.get("/{route_id}/alternatives")
-def route_alternatives(route_id: int, start_lon: float, start_lat: float, end_lon: float, end_lat: float, db: Session = Depends(get_db)):
-    """Get alternative routes between start and end coordinates."""
-    # Import here to avoid circular imports
-    from Traffic_Backend.main import road_network_graph
-    
-    if road_network_graph is None or len(road_network_graph.nodes()) == 0:
+def _compute_alternatives(graph: Optional[nx.DiGraph], start_lon: float, start_lat: float, end_lon: float, end_lat: float, k: int = 3) -> List[AlternativeRoute]:
+    """Snap both coordinates to the graph and rank the k shortest alternatives between them."""
+    if graph is None or graph.number_of_nodes() == 0:
         raise HTTPException(status_code=400, detail="Road network not loaded")
 
     # Find nearest nodes
-    start_node = _find_nearest_node((start_lon, start_lat), road_network_graph)
-    end_node = _find_nearest_node((end_lon, end_lat), road_network_graph)
+    start_node = _find_nearest_node((start_lon, start_lat), graph)
+    end_node = _find_nearest_node((end_lon, end_lat), graph)
     
     if not start_node or not end_node:
         raise HTTPException(status_code=400, detail="Could not locate start or end coordinate on road network")
 
-    # Find alternative paths
-    paths = _find_alternatives(start_node, end_node, road_network_graph, k=3)
-    
-    if not paths:
-        return {"route_id": route_id, "alternatives": []}
-
     # Score and rank alternatives
     alternatives = []
-    for idx, path in enumerate(paths):
-        path_length = sum(road_network_graph[path[i]][path[i+1]].get('length', 0) for i in range(len(path)-1))
+    for idx, (path, path_length) in enumerate(_cached_alternatives(graph, start_node, end_node, k)):
         approx_km = round(path_length * 111, 4)
-        score = _score_alternative(path, road_network_graph, db)
+        score = _score_alternative(path_length)
         alternatives.append(AlternativeRoute(route_id=idx, length_km=approx_km, num_segments=len(path)-1, suitability_score=score, rank=idx+1))
+    return alternatives
+
 
+@router.get("/{route_id}/alternatives")
+def route_alternatives(route_id: int, start_lon: float, start_lat: float, end_lon: float, end_lat: float, request: Request, db: Session = Depends(get_db)):
+    """Get alternative routes between start and end coordinates."""
+    alternatives = _compute_alternatives(request.app.state.road_network_graph, start_lon, start_lat, end_lon, end_lat)
     return {"route_id": route_id, "alternatives": alternatives}
 
 
 @router.post("/{route_id}/recommend", response_model=RecommendationResponse)
-def route_recommend(route_id: int, start_lon: float, start_lat: float, end_lon: float, end_lat: float, db: Session = Depends(get_db)):
+def route_recommend(route_id: int, start_lon: float, start_lat: float, end_lon: float, end_lat: float, request: Request, db: Session = Depends(get_db)):
     """Get recommended alternative route based on suitability scoring."""
-    from Traffic_Backend.main import road_network_graph
+    alternatives = _compute_alternatives(request.app.state.road_network_graph, start_lon, start_lat, end_lon, end_lat)
     
-    if road_network_graph is None or len(road_network_graph.nodes()) == 0:
-        raise HTTPException(status_code=400, detail="Road network not loaded")
-
-    start_node = _find_nearest_node((start_lon, start_lat), road_network_graph)
-    end_node = _find_nearest_node((end_lon, end_lat), road_network_graph)
-    
-    if not start_node or not end_node:
-        raise HTTPException(status_code=400, detail="Could not locate start or end coordinate on road network")
-
-    paths = _find_alternatives(start_node, end_node, road_network_graph, k=3)
-    
-    if not paths:
+    if not alternatives:
         return RecommendationResponse(route_id=route_id, recommended_alternative_id=None, all_alternatives=[], recommendation_justification="No alternative routes found")
 
-    alternatives = []
-    for idx, path in enumerate(paths):
-        path_length = sum(road_network_graph[path[i]][path[i+1]].get('length', 0) for i in range(len(path)-1))
-        approx_km = round(path_length * 111, 4)
-        score = _score_alternative(path, road_network_graph, db)
-        alternatives.append(AlternativeRoute(route_id=idx, length_km=approx_km, num_segments=len(path)-1, suitability_score=score, rank=idx+1))
-
     # Recommend the highest-scoring alternative
     best_alt = max(alternatives, key=lambda a: a.suitability_score)
     justification = f"Route {best_alt.route_id} recommended: length {best_alt.length_km} km, score {best_alt.suitability_score:.4f}"
@@ -696,22 +754,27 @@ def _generate_mock_alternatives(payload: RouteAnalyzeRequest):
         coords.extend([[wp['lon'], wp['lat']] for wp in payload.waypoints])
     coords.append([payload.end_lon, payload.end_lat])
     
-    alts = []
-    for i in range(3):
-        factor = (i - 1) * 0.001
-        perturbed = [[c[0] + factor * (random.random() - 0.5), c[1] + factor * (random.random() - 0.5)] for c in coords]
-        ls = LineString([(c[0], c[1]) for c in perturbed])
-        dist_km = round(ls.length * 111, 4)
-        alts.append({
+    # All three variants in one (3, N, 2) array, perturbed by -0.001, 0 and +0.001 degrees
+    factors = (np.arange(3) - 1) * 0.001
+    variants = np.asarray(coords, dtype=np.float64) + factors[:, None, None] * (_rng.random((3, len(coords), 2)) - 0.5)
+    steps = np.diff(variants, axis=1)
+    distances_km = np.round(np.hypot(steps[..., 0], steps[..., 1]).sum(axis=1) * 111, 4).tolist()
+    traffic_scores = np.round(_rng.random(3), 3).tolist()
+    emissions = (_rng.random(3) * 1000).astype(int).tolist()
+
+    alts = [
+        {
             "id": f"mock-{i+1}",
             "name": f"Alt {i+1}",
-            "coordinates": perturbed,
+            "coordinates": variant,
             "distance_km": dist_km,
             "travel_time_min": max(1, int(dist_km * 2)),
-            "traffic_score": round(random.random(), 3),
-            "emission_g": int(random.random() * 1000),
+            "traffic_score": traffic_scores[i],
+            "emission_g": emissions[i],
             "rank": i+1
-        })
+        }
+        for i, (variant, dist_km) in enumerate(zip(variants.tolist(), distances_km))
+    ]
     
     return {"routes": alts}
 
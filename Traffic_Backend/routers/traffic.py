@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse
+from typing import Dict, List, Optional
 from pydantic import BaseModel
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-import random
+import numpy as np
 import Traffic_Backend.models as models
-from Traffic_Backend.db_config import SessionLocal
+from Traffic_Backend.db_config import SessionLocal, upsert
 from Traffic_Backend.auth import require_role, get_current_user
 
-router = APIRouter(prefix="/traffic", tags=["traffic"])
+router = APIRouter(prefix="/traffic", tags=["traffic"], default_response_class=ORJSONResponse)
+
+# Shared generator for the mock data; values are drawn in batches per request
+_rng = np.random.default_rng()
 
 
 def get_db():
@@ -42,27 +47,33 @@ def traffic_live(route_id: int, db: Session = Depends(get_db)):
 
 @router.get("/history/{route_id}")
 def traffic_history(route_id: int, limit: int = 100, db: Session = Depends(get_db)):
-    entries = db.query(models.TrafficDynamics).filter(models.TrafficDynamics.road_segment_id == route_id).order_by(models.TrafficDynamics.timestamp.desc()).limit(limit).all()
+    # Select just the returned columns; plain rows skip ORM object construction
+    entries = db.query(
+        models.TrafficDynamics.timestamp,
+        models.TrafficDynamics.vehicle_count,
+        models.TrafficDynamics.average_speed,
+        models.TrafficDynamics.congestion_state
+    ).filter(models.TrafficDynamics.road_segment_id == route_id).order_by(models.TrafficDynamics.timestamp.desc()).limit(limit).all()
     return {"route_id": route_id, "count": len(entries), "entries": [
-        {"timestamp": e.timestamp, "vehicle_count": e.vehicle_count, "avg_speed": e.average_speed, "congestion_state": e.congestion_state} for e in entries
+        {"timestamp": timestamp, "vehicle_count": vehicle_count, "avg_speed": average_speed, "congestion_state": congestion_state}
+        for timestamp, vehicle_count, average_speed, congestion_state in entries
     ]}
 
 
 @router.post("/threshold/configure", dependencies=[Depends(require_role("admin"))])
 def configure_threshold(payload: TrafficThreshold, db: Session = Depends(get_db)):
-    # Check if threshold already exists for this road segment
-    existing = db.query(models.TrafficThreshold).filter(models.TrafficThreshold.road_segment_id == payload.route_id).first()
-    if existing:
-        existing.vehicle_count_limit = payload.vehicle_count_limit
-        existing.density_limit = payload.density_limit
-        db.add(existing)
-    else:
-        threshold = models.TrafficThreshold(
-            road_segment_id=payload.route_id,
-            vehicle_count_limit=payload.vehicle_count_limit,
-            density_limit=payload.density_limit
-        )
-        db.add(threshold)
+    # One threshold per road segment: insert it, or update the limits if it already exists
+    db.execute(upsert(
+        db,
+        models.TrafficThreshold,
+        {
+            "road_segment_id": payload.route_id,
+            "vehicle_count_limit": payload.vehicle_count_limit,
+            "density_limit": payload.density_limit
+        },
+        conflict_columns=["road_segment_id"],
+        update_columns=["vehicle_count_limit", "density_limit"]
+    ))
     db.commit()
     return {"road_segment_id": payload.route_id, "configured": True}
 
@@ -81,93 +92,138 @@ def get_threshold(route_id: int, db: Session = Depends(get_db)):
     }
 
 
+# Tables whose planner statistics drive the history, metrics and threshold lookups
+ANALYZE_TABLES = (models.TrafficDynamics, models.RoadNetwork, models.TrafficThreshold)
+# A table is re-analyzed once its row count has moved by more than this fraction
+ANALYZE_MIN_CHANGE = 0.1
+_analyzed_row_counts: Dict[str, int] = {}
+
+
+def _refresh_planner_stats(db: Session, force: bool = False) -> Dict[str, bool]:
+    """Run ANALYZE on tables whose row count changed enough since the last run; returns table -> analyzed."""
+    statement = "ANALYZE TABLE {}" if db.get_bind().dialect.name == 'mysql' else "ANALYZE {}"
+    analyzed = {}
+    for model in ANALYZE_TABLES:
+        table = model.__tablename__
+        rows = db.query(func.count()).select_from(model).scalar()
+        last = _analyzed_row_counts.get(table)
+        stale = force or last is None or abs(rows - last) > max(last, 1) * ANALYZE_MIN_CHANGE
+        if stale:
+            db.execute(text(statement.format(table)))
+            _analyzed_row_counts[table] = rows
+        analyzed[table] = stale
+    db.commit()
+    return analyzed
+
+
+@router.post("/maintenance/analyze", dependencies=[Depends(require_role("admin"))])
+def analyze_tables(force: bool = False, db: Session = Depends(get_db)):
+    """
+    Refresh query planner statistics after bulk loads of traffic data.
+    Small changes are skipped unless force is set.
+    """
+    analyzed = _refresh_planner_stats(db, force)
+    return {
+        "analyzed": [table for table, done in analyzed.items() if done],
+        "skipped": [table for table, done in analyzed.items() if not done]
+    }
+
+
 @router.get("/live")
 def traffic_live_all(db: Session = Depends(get_db)):
     """
     Returns live traffic data for all segments with congestion levels.
     Generates mock data for Ahmedabad area if no real data exists.
     """
-    # Try to get real data from database
-    entries = db.query(models.TrafficDynamics).order_by(models.TrafficDynamics.timestamp.desc()).limit(100).all()
+    # One timestamp for the whole response
+    now_iso = datetime.now().isoformat()
+    
+    # Try to get real data from database; each entry comes joined with its road segment
+    rows = db.query(models.TrafficDynamics, models.RoadNetwork).join(
+        models.RoadNetwork, models.RoadNetwork.id == models.TrafficDynamics.road_segment_id
+    ).order_by(models.TrafficDynamics.timestamp.desc()).limit(100).all()
     
-    if entries:
+    if rows:
         # Return real data if available
         segments = []
-        for entry in entries:
-            segment = db.query(models.RoadNetwork).filter(models.RoadNetwork.id == entry.road_segment_id).first()
-            if segment:
-                # Calculate congestion level (0.0 to 1.0)
-                congestion = 0.5  # default
-                if entry.average_speed:
-                    # Lower speed = higher congestion
-                    congestion = max(0.0, min(1.0, 1.0 - (entry.average_speed / 80.0)))
-                
-                segments.append({
-                    "segment_id": f"seg_{entry.road_segment_id}",
-                    "coordinates": [[segment.start_lon, segment.start_lat], [segment.end_lon, segment.end_lat]],
-                    "congestion_level": round(congestion, 2),
-                    "speed_kmh": entry.average_speed or 30,
-                    "vehicle_count": entry.vehicle_count or 0,
-                    "timestamp": entry.timestamp.isoformat() if entry.timestamp else datetime.now().isoformat()
-                })
-        
-        return {"segments": segments, "timestamp": datetime.now().isoformat()}
+        for entry, segment in rows:
+            # Calculate congestion level (0.0 to 1.0)
+            congestion = 0.5  # default
+            if entry.average_speed:
+                # Lower speed = higher congestion
+                congestion = max(0.0, min(1.0, 1.0 - (entry.average_speed / 80.0)))
+            
+            segments.append({
+                "segment_id": f"seg_{entry.road_segment_id}",
+                "coordinates": [[segment.start_lon, segment.start_lat], [segment.end_lon, segment.end_lat]],
+                "congestion_level": round(congestion, 2),
+                "speed_kmh": entry.average_speed or 30,
+                "vehicle_count": entry.vehicle_count or 0,
+                "timestamp": entry.timestamp.isoformat() if entry.timestamp else now_iso
+            })
+    
+        return {"segments": segments, "timestamp": now_iso}
     
     # Generate mock traffic data for Ahmedabad area
-    mock_segments = _generate_mock_traffic_segments()
-    return {"segments": mock_segments, "timestamp": datetime.now().isoformat(), "mock": True}
+    mock_segments = _generate_mock_traffic_segments(now_iso)
+    return {"segments": mock_segments, "timestamp": now_iso, "mock": True}
+
+
+# Ahmedabad major roads (approximate coordinates)
+_MAJOR_ROADS = [
+    # SG Highway
+    {"start": [72.5200, 23.0300], "end": [72.5400, 23.0500], "name": "SG Highway North"},
+    {"start": [72.5400, 23.0500], "end": [72.5600, 23.0700], "name": "SG Highway Central"},
+    {"start": [72.5600, 23.0700], "end": [72.5800, 23.0900], "name": "SG Highway South"},
 
+    # Ashram Road
+    {"start": [72.5800, 23.0200], "end": [72.5900, 23.0400], "name": "Ashram Road"},
 
-def _generate_mock_traffic_segments():
+    # CG Road
+    {"start": [72.5500, 23.0300], "end": [72.5700, 23.0350], "name": "CG Road"},
+
+    # Nehru Bridge area
+    {"start": [72.5850, 23.0350], "end": [72.5950, 23.0400], "name": "Nehru Bridge"},
+
+    # Paldi area
+    {"start": [72.5600, 23.0200], "end": [72.5700, 23.0250], "name": "Paldi Road"},
+
+    # Maninagar
+    {"start": [72.6000, 23.0100], "end": [72.6100, 23.0200], "name": "Maninagar Road"},
+]
+
+
+def _generate_mock_traffic_segments(now_iso: Optional[str] = None):
     """
     Generate mock traffic segments for Ahmedabad area.
-    Creates realistic-looking traffic data on major roads.
+    Creates realistic-looking traffic data on major roads, all stamped with now_iso.
     """
-    # Ahmedabad major roads (approximate coordinates)
-    major_roads = [
-        # SG Highway
-        {"start": [72.5200, 23.0300], "end": [72.5400, 23.0500], "name": "SG Highway North"},
-        {"start": [72.5400, 23.0500], "end": [72.5600, 23.0700], "name": "SG Highway Central"},
-        {"start": [72.5600, 23.0700], "end": [72.5800, 23.0900], "name": "SG Highway South"},
-        
-        # Ashram Road
-        {"start": [72.5800, 23.0200], "end": [72.5900, 23.0400], "name": "Ashram Road"},
-        
-        # CG Road
-        {"start": [72.5500, 23.0300], "end": [72.5700, 23.0350], "name": "CG Road"},
-        
-        # Nehru Bridge area
-        {"start": [72.5850, 23.0350], "end": [72.5950, 23.0400], "name": "Nehru Bridge"},
-        
-        # Paldi area
-        {"start": [72.5600, 23.0200], "end": [72.5700, 23.0250], "name": "Paldi Road"},
-        
-        # Maninagar
-        {"start": [72.6000, 23.0100], "end": [72.6100, 23.0200], "name": "Maninagar Road"},
-    ]
+    now_iso = now_iso or datetime.now().isoformat()
+    n = len(_MAJOR_ROADS)
+    # Vary congestion by time simulation; one draw per road
+    congestion = np.clip(_rng.uniform(0.2, 0.8, n) + _rng.uniform(-0.1, 0.1, n), 0.0, 1.0)
     
-    segments = []
-    for i, road in enumerate(major_roads):
-        # Vary congestion by time simulation
-        base_congestion = random.uniform(0.2, 0.8)
-        congestion = max(0.0, min(1.0, base_congestion + random.uniform(-0.1, 0.1)))
-        
-        # Speed inversely related to congestion
-        max_speed = 60
-        speed = max(10, int(max_speed * (1 - congestion)))
-        
-        # Vehicle count based on congestion
-        vehicle_count = int(50 + congestion * 150)
-        
-        segments.append({
+    # Speed inversely related to congestion
+    max_speed = 60
+    speeds = np.maximum(10, (max_speed * (1 - congestion)).astype(int))
+    
+    # Vehicle count based on congestion
+    vehicle_counts = (50 + congestion * 150).astype(int)
+    
+    segments = [
+        {
             "segment_id": f"seg_{i+1:03d}",
             "name": road["name"],
             "coordinates": [road["start"], road["end"]],
-            "congestion_level": round(congestion, 2),
+            "congestion_level": level,
             "speed_kmh": speed,
             "vehicle_count": vehicle_count,
-            "timestamp": datetime.now().isoformat()
-        })
+            "timestamp": now_iso
+        }
+        for i, (road, level, speed, vehicle_count) in enumerate(
+            zip(_MAJOR_ROADS, np.round(congestion, 2).tolist(), speeds.tolist(), vehicle_counts.tolist())
+        )
+    ]
     
     return segments
 
@@ -180,42 +236,49 @@ def traffic_alerts(db: Session = Depends(get_db)):
     """
     # Check for real alerts in notifications or thresholds
     # For now, generate mock alerts
-    mock_alerts = _generate_mock_alerts()
-    return {"alerts": mock_alerts, "timestamp": datetime.now().isoformat()}
+    now = datetime.now()
+    mock_alerts = _generate_mock_alerts(now)
+    return {"alerts": mock_alerts, "timestamp": now.isoformat()}
+
+
+_ALERT_TYPES = [
+    {"type": "accident", "severity": "high", "icon": "⚠️"},
+    {"type": "construction", "severity": "medium", "icon": "🚧"},
+    {"type": "congestion", "severity": "medium", "icon": "🚗"},
+    {"type": "event", "severity": "low", "icon": "📅"},
+]
+
+# Ahmedabad locations for alerts
+_ALERT_LOCATIONS = [
+    {"lat": 23.0450, "lon": 72.5570, "area": "SG Highway near Shyamal"},
+    {"lat": 23.0225, "lon": 72.5714, "area": "Ashram Road"},
+    {"lat": 23.0350, "lon": 72.5850, "area": "Nehru Bridge"},
+    {"lat": 23.0300, "lon": 72.5650, "area": "Panjrapole"},
+]
+
+# Message templates per alert type, filled with the location's area
+_ALERT_MESSAGES = {
+    "accident": "Multi-vehicle accident reported at {area}",
+    "construction": "Road work in progress at {area}",
+    "congestion": "Heavy traffic congestion at {area}",
+    "event": "Special event causing delays near {area}"
+}
 
 
-def _generate_mock_alerts():
+def _generate_mock_alerts(now: Optional[datetime] = None):
     """
-    Generate mock traffic alerts for demo purposes.
+    Generate mock traffic alerts for demo purposes, reported 5-60 minutes before now.
     """
-    alert_types = [
-        {"type": "accident", "severity": "high", "icon": "⚠️"},
-        {"type": "construction", "severity": "medium", "icon": "🚧"},
-        {"type": "congestion", "severity": "medium", "icon": "🚗"},
-        {"type": "event", "severity": "low", "icon": "📅"},
-    ]
-    
-    # Ahmedabad locations for alerts
-    alert_locations = [
-        {"lat": 23.0450, "lon": 72.5570, "area": "SG Highway near Shyamal"},
-        {"lat": 23.0225, "lon": 72.5714, "area": "Ashram Road"},
-        {"lat": 23.0350, "lon": 72.5850, "area": "Nehru Bridge"},
-        {"lat": 23.0300, "lon": 72.5650, "area": "Panjrapole"},
-    ]
-    
+    now = now or datetime.now()
     alerts = []
-    num_alerts = random.randint(2, 4)  # Generate 2-4 alerts
+    num_alerts = int(_rng.integers(2, 5))  # Generate 2-4 alerts
+    type_idx = _rng.integers(0, len(_ALERT_TYPES), num_alerts).tolist()
+    location_idx = _rng.integers(0, len(_ALERT_LOCATIONS), num_alerts).tolist()
+    delays = _rng.integers(5, 61, num_alerts).tolist()
     
     for i in range(num_alerts):
-        alert_type = random.choice(alert_types)
-        location = random.choice(alert_locations)
-        
-        messages = {
-            "accident": f"Multi-vehicle accident reported at {location['area']}",
-            "construction": f"Road work in progress at {location['area']}",
-            "congestion": f"Heavy traffic congestion at {location['area']}",
-            "event": f"Special event causing delays near {location['area']}"
-        }
+        alert_type = _ALERT_TYPES[type_idx[i]]
+        location = _ALERT_LOCATIONS[location_idx[i]]
         
         alerts.append({
             "id": i + 1,
@@ -224,8 +287,8 @@ def _generate_mock_alerts():
             "icon": alert_type["icon"],
             "location": [location["lon"], location["lat"]],
             "area": location["area"],
-            "message": messages[alert_type["type"]],
-            "timestamp": (datetime.now() - timedelta(minutes=random.randint(5, 60))).isoformat(),
+            "message": _ALERT_MESSAGES[alert_type["type"]].format(area=location["area"]),
+            "timestamp": (now - timedelta(minutes=delays[i])).isoformat(),
             "affected_routes": [1, 2] if alert_type["severity"] == "high" else []
         })
     
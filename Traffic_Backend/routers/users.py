@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import Optional
 from sqlalchemy.orm import Session
 import Traffic_Backend.models as models
 from Traffic_Backend.db_config import SessionLocal
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], default_response_class=ORJSONResponse)
 
 
 def get_db():
@@ -32,7 +33,7 @@ class UserUpdate(BaseModel):
 
 @router.get("/{user_id}", response_model=UserOut)
 def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -40,12 +41,11 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
 
 @router.put("/{user_id}", response_model=UserOut)
 def update_user(user_id: int, payload: UserUpdate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     for k, v in payload.dict(exclude_unset=True).items():
         setattr(user, k, v)
-    db.add(user)
+    # user is already tracked by the session, so committing is enough
     db.commit()
-    db.refresh(user)
     return user
@@ -3,40 +3,303 @@ GPS Vehicle Tracking Router
 Provides real-time vehicle location tracking with WebSocket support
 """
 from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import bindparam, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Optional, Dict, Set, Tuple
 from datetime import datetime
-import json
+from collections import OrderedDict
+from functools import lru_cache
+import asyncio
+import logging
+import math
+import os
+import orjson
+import time
+import zlib
 
-from Traffic_Backend.db_config import get_db
+from Traffic_Backend.db_config import get_db, upsert
 from Traffic_Backend.models import Vehicle
 
-router = APIRouter(prefix="/vehicles", tags=["vehicles"])
+# Optional Redis pub/sub so that every worker process sees every vehicle update
+try:
+    import redis.asyncio as aioredis  # type: ignore
+    from redis.exceptions import RedisError  # type: ignore
+except Exception:
+    aioredis = None  # type: ignore
+    RedisError = OSError  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/vehicles", tags=["vehicles"], default_response_class=ORJSONResponse)
+
+# Outbound messages buffered per client; a client that falls this far behind is dropped
+OUTBOUND_QUEUE_SIZE = 256
+# Messages arriving within this window after the first are coalesced into one batch frame,
+# flushed early once the batch reaches COALESCE_MAX_BYTES
+COALESCE_WINDOW_SECONDS = 0.05
+COALESCE_MAX_BYTES = 128 * 1024
+# Clients connecting with ?compress=deflate-raw get raw-deflated frames at this level; frames are
+# compressed here once for all such clients, so run uvicorn with --ws-per-message-deflate false
+WS_DEFLATE_LEVEL = 1
+
+
+# Only needs to span one fan-out: clients flush the same frames at about the same time, and a
+# batch frame can be up to COALESCE_MAX_BYTES, so only a handful are kept
+@lru_cache(maxsize=8)
+def _deflate(frame: bytes) -> bytes:
+    """Raw-deflate one frame on its own, so a client can inflate any frame it receives.
+    Cached because every compressing client flushes the same frames."""
+    compressor = zlib.compressobj(WS_DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(frame) + compressor.flush()
+
 
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # A set so disconnects stay O(1) during reconnect storms; broadcast order doesn't matter
+        self.active_connections: Set[WebSocket] = set()
+        # Each client gets its own bounded queue drained by its own writer task,
+        # so a slow client only ever delays itself
+        self.outbound: Dict[WebSocket, asyncio.Queue] = {}
+        self.writers: Dict[WebSocket, asyncio.Task] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, compress: bool = False):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
+        self.outbound[websocket] = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self.writers[websocket] = asyncio.create_task(self._writer(websocket, compress))
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        # Broadcast may already have dropped it as dead or too slow
+        self.active_connections.discard(websocket)
+        self.outbound.pop(websocket, None)
+        writer = self.writers.pop(websocket, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
 
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass  # Connection might be closed
+    async def _writer(self, websocket: WebSocket, compress: bool = False):
+        queue = self.outbound[websocket]
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch = [await queue.get()]
+                size = len(batch[0])
+                deadline = loop.time() + COALESCE_WINDOW_SECONDS
+                while size < COALESCE_MAX_BYTES:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                    size += len(batch[-1])
+                await self._flush(websocket, batch, compress)
+        except Exception:
+            self.disconnect(websocket)
+
+    @staticmethod
+    async def _flush(websocket: WebSocket, batch: List[bytes], compress: bool = False):
+        """Send one binary frame: a lone message as is, several as {"type": "batch", "items": [...]}"""
+        if len(batch) == 1:
+            frame = batch[0]
+        else:
+            # Items are already JSON, so the batch is assembled without re-encoding them
+            frame = b'{"type":"batch","items":[' + b",".join(batch) + b']}'
+        await websocket.send_bytes(_deflate(frame) if compress else frame)
+
+    def send(self, websocket: WebSocket, payload: bytes):
+        """Queue an already serialized message for one client; drops the client if its queue is full"""
+        try:
+            self.outbound[websocket].put_nowait(payload)
+        except asyncio.QueueFull:
+            self.disconnect(websocket)
+
+    def broadcast(self, message: dict):
+        """Serialize message once (orjson, UTF-8 bytes) and queue it for every connected client"""
+        self.broadcast_payload(orjson.dumps(message))
+
+    def broadcast_payload(self, payload: bytes):
+        """Queue an already serialized message for every connected client"""
+        for connection in list(self.active_connections):
+            self.send(connection, payload)
 
 manager = ConnectionManager()
 
 
+# With REDIS_URL set, updates are published to one channel and every worker relays the channel
+# to its own sockets; without it, updates go straight to this process's sockets
+REDIS_URL = os.getenv('REDIS_URL')
+UPDATES_CHANNEL = "vehicles:updates"
+_redis = None
+_relay_task: Optional[asyncio.Task] = None
+# Whether this worker is currently subscribed; while it isn't, its own updates go to its sockets directly
+_relay_live = False
+# The relay resubscribes after a lost connection, backing off from the first delay up to the second
+RELAY_RETRY_SECONDS = 1.0
+RELAY_RETRY_MAX_SECONDS = 30.0
+
+
+async def publish_update(payload: bytes):
+    """Deliver a serialized message to the WebSocket clients of every worker"""
+    if _redis is not None:
+        try:
+            await _redis.publish(UPDATES_CHANNEL, payload)
+        except (RedisError, OSError) as exc:
+            # The update is already committed; a Redis outage must not turn it into an error
+            logger.warning("Publishing vehicle update to Redis failed (%s); delivering to local clients only", exc)
+        else:
+            if _relay_live:
+                return
+    manager.broadcast_payload(payload)
+
+
+async def _relay_updates(client):
+    """Forward channel messages to this worker's sockets, resubscribing with backoff if Redis drops"""
+    global _relay_live
+    delay = RELAY_RETRY_SECONDS
+    while True:
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(UPDATES_CHANNEL)
+            _relay_live = True
+            delay = RELAY_RETRY_SECONDS
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    manager.broadcast_payload(message["data"])
+            return
+        except (RedisError, OSError) as exc:
+            logger.warning("Vehicle update relay lost its Redis subscription (%s); retrying in %.0f s", exc, delay)
+        finally:
+            _relay_live = False
+            try:
+                await pubsub.reset()
+            except (RedisError, OSError):
+                pass
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RELAY_RETRY_MAX_SECONDS)
+
+
+@router.on_event("startup")
+async def _start_update_relay():
+    global _redis, _relay_task
+    if not REDIS_URL:
+        return
+    if aioredis is None:
+        print("WARNING: REDIS_URL is set but the redis package is not installed; broadcasting to local clients only")
+        return
+    _redis = aioredis.from_url(REDIS_URL)
+    _relay_task = asyncio.create_task(_relay_updates(_redis))
+
+
+@router.on_event("shutdown")
+async def _stop_update_relay():
+    global _redis, _relay_task
+    if _relay_task is not None:
+        _relay_task.cancel()
+        _relay_task = None
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
+
+
+# Statements are built once and bound per call, so SQLAlchemy reuses the compiled SQL across requests
+_VEHICLE_BY_ID = select(Vehicle).where(Vehicle.vehicle_id == bindparam('vehicle_id'))
+
+# A NULL filter parameter matches every row, so one statement serves all filter combinations
+_VEHICLES_FILTERED = select(Vehicle).where(
+    or_(bindparam('status').is_(None), Vehicle.status == bindparam('status')),
+    or_(bindparam('vehicle_type').is_(None), Vehicle.vehicle_type == bindparam('vehicle_type'))
+)
+
+
+# Location pings write the row in one statement; parameter names must differ from the
+# vehicles column names, which UPDATE reserves for itself
+_UPDATE_LOCATION = update(Vehicle).where(Vehicle.vehicle_id == bindparam('vid')).values(
+    current_lat=bindparam('new_lat'),
+    current_lon=bindparam('new_lon'),
+    speed=bindparam('new_speed'),
+    heading=bindparam('new_heading'),
+    last_update=bindparam('new_last_update'),
+    status='active'
+).execution_options(synchronize_session=False)
+_UPDATE_LOCATION_RETURNING = _UPDATE_LOCATION.returning(Vehicle.vehicle_type)
+_VEHICLE_TYPE_BY_ID = select(Vehicle.vehicle_type).where(Vehicle.vehicle_id == bindparam('vid'))
+
+# A status write is one statement whose rowcount doubles as the existence check: SQLite counts
+# matched rows, and SQLAlchemy's MySQL dialects connect with FOUND_ROWS, so 0 means no such vehicle
+_SET_STATUS = update(Vehicle).where(
+    Vehicle.vehicle_id == bindparam('vid')
+).values(status=bindparam('new_status')).execution_options(synchronize_session=False)
+
+
+# Last status written by this process per vehicle_id. Only a hint for when to drop the cached
+# listings: writes from other processes are not seen, so it never decides what reaches the database.
+_status_cache: Dict[str, str] = {}
+
+# Serialized vehicle listings per (status, vehicle_type) filter, as (monotonic time, JSON bytes).
+# Dropped whenever a vehicle is added, removed or changes status; positions may lag by up to the TTL.
+# Filters are client-supplied, so only the most recently stored LIST_CACHE_MAX_ENTRIES are kept.
+LIST_CACHE_TTL_SECONDS = 1.0
+LIST_CACHE_MAX_ENTRIES = 64
+_list_cache: "OrderedDict[Tuple[Optional[str], Optional[str]], Tuple[float, bytes]]" = OrderedDict()
+VEHICLE_STATUSES = ('active', 'idle', 'offline')
+
+
+def _get_vehicle(db: Session, vehicle_id: str) -> Optional[Vehicle]:
+    return db.execute(_VEHICLE_BY_ID, {"vehicle_id": vehicle_id}).scalar_one_or_none()
+
+
+def vehicle_or_404(vehicle_id: str, db: Session = Depends(get_db)) -> Vehicle:
+    """Dependency resolving the path's vehicle_id to its Vehicle row."""
+    vehicle = _get_vehicle(db, vehicle_id)
+    if not vehicle:
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+    return vehicle
+
+
+def _update_location(db: Session, params: dict) -> Optional[str]:
+    """Apply and commit a location update; returns the vehicle type, or None if there is no such vehicle."""
+    if db.get_bind().dialect.update_returning:
+        vehicle_type = db.execute(_UPDATE_LOCATION_RETURNING, params).scalar_one_or_none()
+    else:
+        # MySQL has no UPDATE ... RETURNING
+        db.execute(_UPDATE_LOCATION, params)
+        vehicle_type = db.execute(_VEHICLE_TYPE_BY_ID, params).scalar_one_or_none()
+    if vehicle_type is not None:
+        db.commit()
+    return vehicle_type
+
+
+# Location updates have a fixed shape, so the frame is a bytes template filled with %-formatting
+# instead of building and encoding a dict per update. Strings go through orjson for escaping.
+_LOCATION_FRAME = (
+    b'{"type":"location_update","vehicle_id":%b,"data":{"lat":%b,"lon":%b,"speed":%b,"heading":%b,'
+    b'"vehicle_type":%b,"status":"active","timestamp":"%b"}}'
+)
+
+
+def _json_number(value: Optional[float]) -> bytes:
+    # float repr is valid JSON except for inf/nan, which are sent as null like orjson does
+    return b'%a' % value if value is not None and math.isfinite(value) else b'null'
+
+
+def _location_frame(vehicle_id: str, location: "VehicleLocation", vehicle_type: str, timestamp: datetime) -> bytes:
+    return _LOCATION_FRAME % (
+        orjson.dumps(vehicle_id),
+        _json_number(location.lat),
+        _json_number(location.lon),
+        _json_number(location.speed),
+        _json_number(location.heading),
+        orjson.dumps(vehicle_type),
+        timestamp.isoformat().encode()
+    )
+
+
 # Pydantic models
 class VehicleRegister(BaseModel):
     vehicle_id: str
@@ -65,27 +328,45 @@ class VehicleResponse(BaseModel):
     class Config:
         from_attributes = True
 
+_vehicle_list = TypeAdapter(List[VehicleResponse])
+
 
 # REST API Endpoints
 @router.post("/register", response_model=VehicleResponse)
 def register_vehicle(vehicle: VehicleRegister, db: Session = Depends(get_db)):
     """Register a new vehicle in the system"""
-    # Check if vehicle already exists
-    existing = db.query(Vehicle).filter(Vehicle.vehicle_id == vehicle.vehicle_id).first()
-    if existing:
+    values = {
+        "vehicle_id": vehicle.vehicle_id,
+        "vehicle_type": vehicle.vehicle_type,
+        "driver_name": vehicle.driver_name,
+        "status": 'offline',
+        "registration_date": datetime.now()
+    }
+    if db.get_bind().dialect.insert_returning:
+        # Insert unless the vehicle_id is taken, in one statement so concurrent registrations can't both succeed
+        stmt = upsert(db, Vehicle, values, conflict_columns=["vehicle_id"])
+        db_vehicle = db.scalars(stmt.returning(Vehicle)).first()
+    else:
+        # MySQL: a plain INSERT, with the unique vehicle_id rejecting a concurrent duplicate.
+        # The savepoint keeps the session usable after that IntegrityError; any other
+        # integrity error (the vehicle still doesn't exist) is re-raised
+        try:
+            with db.begin_nested():
+                db.execute(insert(Vehicle).values(**values))
+        except IntegrityError:
+            if _get_vehicle(db, vehicle.vehicle_id) is None:
+                raise
+            db_vehicle = None
+        else:
+            db_vehicle = _get_vehicle(db, vehicle.vehicle_id)
+    if db_vehicle is None:
         raise HTTPException(status_code=400, detail="Vehicle already registered")
-    
-    db_vehicle = Vehicle(
-        vehicle_id=vehicle.vehicle_id,
-        vehicle_type=vehicle.vehicle_type,
-        driver_name=vehicle.driver_name,
-        status='offline',
-        registration_date=datetime.now()
-    )
-    db.add(db_vehicle)
+    # Built before commit, which would expire the instance and cost a reload
+    response = VehicleResponse.model_validate(db_vehicle)
     db.commit()
-    db.refresh(db_vehicle)
-    return db_vehicle
+    _status_cache[response.vehicle_id] = response.status
+    _list_cache.clear()
+    return response
 
 
 @router.get("/", response_model=List[VehicleResponse])
@@ -95,22 +376,27 @@ def get_all_vehicles(
     db: Session = Depends(get_db)
 ):
     """Get all vehicles with optional filters"""
-    query = db.query(Vehicle)
-    
-    if status:
-        query = query.filter(Vehicle.status == status)
-    if vehicle_type:
-        query = query.filter(Vehicle.vehicle_type == vehicle_type)
-    
-    return query.all()
+    key = (status or None, vehicle_type or None)
+    cached = _list_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < LIST_CACHE_TTL_SECONDS:
+        return Response(content=cached[1], media_type="application/json")
+    vehicles = db.execute(_VEHICLES_FILTERED, {"status": key[0], "vehicle_type": key[1]}).scalars().all()
+    content = _vehicle_list.dump_json(_vehicle_list.validate_python(vehicles, from_attributes=True))
+    # No vehicle can have an unknown status, so those listings are not worth a cache slot
+    if key[0] is None or key[0] in VEHICLE_STATUSES:
+        _list_cache.pop(key, None)
+        _list_cache[key] = (time.monotonic(), content)
+        while len(_list_cache) > LIST_CACHE_MAX_ENTRIES:
+            try:
+                _list_cache.popitem(last=False)
+            except KeyError:  # Emptied by a concurrent write
+                break
+    return Response(content=content, media_type="application/json")
 
 
 @router.get("/{vehicle_id}", response_model=VehicleResponse)
-def get_vehicle(vehicle_id: str, db: Session = Depends(get_db)):
+def get_vehicle(vehicle: Vehicle = Depends(vehicle_or_404)):
     """Get vehicle details by vehicle_id"""
-    vehicle = db.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
-    if not vehicle:
-        raise HTTPException(status_code=404, detail="Vehicle not found")
     return vehicle
 
 
@@ -121,52 +407,45 @@ async def update_vehicle_location(
     db: Session = Depends(get_db)
 ):
     """Update vehicle location and broadcast to WebSocket clients"""
-    vehicle = db.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
-    if not vehicle:
+    # One clock read for the stored row, the broadcast and the response
+    last_update = datetime.now()
+    # The handler is async for the broadcast; the blocking DB work runs in the threadpool
+    # so it doesn't stall the event loop and the WebSocket writers on it
+    vehicle_type = await run_in_threadpool(_update_location, db, {
+        "vid": vehicle_id,
+        "new_lat": location.lat,
+        "new_lon": location.lon,
+        "new_speed": location.speed,
+        "new_heading": location.heading,
+        "new_last_update": last_update
+    })
+    if vehicle_type is None:
         raise HTTPException(status_code=404, detail="Vehicle not found")
-    
-    # Update vehicle location
-    vehicle.current_lat = location.lat
-    vehicle.current_lon = location.lon
-    vehicle.speed = location.speed
-    vehicle.heading = location.heading
-    vehicle.last_update = datetime.now()
-    vehicle.status = 'active'
-    
-    db.commit()
-    db.refresh(vehicle)
+    if _status_cache.get(vehicle_id) != 'active':
+        _list_cache.clear()
+    _status_cache[vehicle_id] = 'active'
     
     # Broadcast to WebSocket clients
-    await manager.broadcast({
-        "type": "location_update",
-        "vehicle_id": vehicle_id,
-        "data": {
-            "lat": location.lat,
-            "lon": location.lon,
-            "speed": location.speed,
-            "heading": location.heading,
-            "vehicle_type": vehicle.vehicle_type,
-            "status": vehicle.status,
-            "timestamp": datetime.now().isoformat()
-        }
-    })
+    await publish_update(_location_frame(vehicle_id, location, vehicle_type, last_update))
     
     return {
         "message": "Location updated",
         "vehicle_id": vehicle_id,
-        "timestamp": vehicle.last_update
+        "timestamp": last_update
     }
 
 
 @router.delete("/{vehicle_id}")
-def deregister_vehicle(vehicle_id: str, db: Session = Depends(get_db)):
+def deregister_vehicle(
+    vehicle: Vehicle = Depends(vehicle_or_404),
+    db: Session = Depends(get_db)
+):
     """Remove vehicle from tracking system"""
-    vehicle = db.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
-    if not vehicle:
-        raise HTTPException(status_code=404, detail="Vehicle not found")
-    
+    vehicle_id = vehicle.vehicle_id
     db.delete(vehicle)
     db.commit()
+    _status_cache.pop(vehicle_id, None)
+    _list_cache.clear()
     return {"message": "Vehicle deregistered", "vehicle_id": vehicle_id}
 
 
@@ -177,15 +456,15 @@ def update_vehicle_status(
     db: Session = Depends(get_db)
 ):
     """Update vehicle status (active, idle, offline)"""
-    if status not in ['active', 'idle', 'offline']:
+    if status not in VEHICLE_STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status")
     
-    vehicle = db.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
-    if not vehicle:
+    if not db.execute(_SET_STATUS, {"vid": vehicle_id, "new_status": status}).rowcount:
         raise HTTPException(status_code=404, detail="Vehicle not found")
-    
-    vehicle.status = status
     db.commit()
+    if _status_cache.get(vehicle_id) != status:
+        _list_cache.clear()
+    _status_cache[vehicle_id] = status
     
     return {"message": "Status updated", "vehicle_id": vehicle_id, "status": status}
 
@@ -194,12 +473,11 @@ def update_vehicle_status(
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time vehicle tracking"""
-    await manager.connect(websocket)
+    await manager.connect(websocket, compress=websocket.query_params.get("compress") == "deflate-raw")
     try:
         while True:
-            # Keep connection alive and listen for messages
-            data = await websocket.receive_text()
-            # Echo back for heartbeat
-            await websocket.send_json({"type": "pong", "timestamp": datetime.now().isoformat()})
+            # Liveness is checked by the server's protocol-level PING frames (uvicorn's
+            # --ws-ping-interval/--ws-ping-timeout), so client messages are only read to notice the close
+            await websocket.receive_text()
     except WebSocketDisconnect:
         manager.disconnect(websocket)
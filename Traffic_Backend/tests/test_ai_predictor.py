@@ -0,0 +1,293 @@
+"""
+Pytest unit tests for ai_predictor module.
+Tests for TrafficPredictor speed prediction.
+"""
+
+import os
+import shutil
+
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+import Traffic_Backend.ai_predictor as ai_predictor
+from Traffic_Backend.ai_predictor import TrafficPredictor
+
+
+def _synthetic_traffic(n: int = 400) -> pd.DataFrame:
+    """Hourly traffic samples with a rush-hour slowdown and some noise."""
+    rng = np.random.default_rng(42)
+    start = datetime(2025, 1, 1)
+    timestamps = [start + timedelta(minutes=53 * i) for i in range(n)]
+    hours = np.array([t.hour for t in timestamps])
+    rush = np.isin(hours, [7, 8, 9, 17, 18, 19])
+    return pd.DataFrame({
+        'timestamp': timestamps,
+        'average_speed': np.where(rush, 25.0, 45.0) + rng.normal(0, 3, n),
+        'vehicle_count': rng.integers(10, 150, n),
+        'road_segment_id': rng.integers(1, 4, n)
+    })
+
+
+@pytest.fixture(scope="module")
+def trained_predictor(tmp_path_factory):
+    predictor = TrafficPredictor(model_path=str(tmp_path_factory.mktemp("models")))
+    predictor.train_speed_model(_synthetic_traffic())
+    return predictor
+
+
+class TestPredictSpeed:
+    """Test suite for single and batched speed prediction."""
+
+    def test_baseline_without_model(self, tmp_path):
+        """Without a trained model on disk, the baseline prediction is returned."""
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+
+        result = predictor.predict_speed_batch([datetime(2025, 2, 3, 8)] * 3, 1)
+
+        assert result['model'] == 'baseline'
+        assert result['predicted_speed'].tolist() == [40.0, 40.0, 40.0]
+
+    def test_disk_checked_at_most_every_recheck_interval(self, tmp_path, monkeypatch):
+        """After a prediction has looked for a model, the next ones within the interval touch no file."""
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+        assert predictor.load_model('speed_model') is False
+
+        predictor.predict_speed(datetime(2025, 2, 3, 8), 1)
+        stats = []
+        monkeypatch.setattr(ai_predictor, '_file_mtime', stats.append)
+
+        assert predictor.predict_speed(datetime(2025, 2, 3, 9), 1)['model'] == 'baseline'
+        assert stats == []
+
+        monkeypatch.setattr(ai_predictor, 'MODEL_RECHECK_SECONDS', 0)
+        predictor.predict_speed(datetime(2025, 2, 3, 10), 1)
+        assert len(stats) == 1
+
+    def test_model_saved_by_another_process_is_picked_up(self, tmp_path, monkeypatch):
+        """A predictor that started without a model uses one saved later to its model path."""
+        monkeypatch.setattr(ai_predictor, 'MODEL_RECHECK_SECONDS', 0)
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+        t = datetime(2025, 2, 3, 8)
+        assert predictor.predict_speed(t, 1)['model'] == 'baseline'
+
+        trainer = TrafficPredictor(model_path=str(tmp_path))
+        trainer.train_speed_model(_synthetic_traffic())
+
+        assert predictor.predict_speed(t, 1) == trainer.predict_speed(t, 1)
+        assert predictor.predict_speed(t, 1)['model'] == 'random_forest'
+        assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+
+    def test_batch_matches_single_predictions(self, trained_predictor):
+        """Batched horizon prediction matches calling predict_speed per timestamp."""
+        start = datetime(2025, 2, 3, 5)
+        times = [start + timedelta(hours=i) for i in range(24)]
+        history = _synthetic_traffic(60)
+
+        batch = trained_predictor.predict_speed_batch(times, 2, history)
+
+        for i, t in enumerate(times):
+            single = trained_predictor.predict_speed(t, 2, history)
+            assert batch['predicted_speed'][i] == pytest.approx(single['predicted_speed'])
+            assert batch['std_dev'][i] == pytest.approx(single['std_dev'])
+            assert batch['confidence'][i] == pytest.approx(single['confidence'])
+
+    def test_precomputed_hist_stats(self, trained_predictor):
+        """Passing hist_stats gives the same prediction as passing the raw history."""
+        history = _synthetic_traffic(60)
+        t = datetime(2025, 2, 3, 17)
+
+        hist_stats = trained_predictor.historical_stats(history)
+
+        assert hist_stats[0] == pytest.approx(history['average_speed'].mean())
+        assert trained_predictor.predict_speed(t, 2, hist_stats=hist_stats) == \
+            trained_predictor.predict_speed(t, 2, history)
+
+    def test_rush_hour_is_slower(self, trained_predictor):
+        """The model picks up the synthetic rush-hour slowdown."""
+        result = trained_predictor.predict_speed_batch(
+            [datetime(2025, 2, 4, 8), datetime(2025, 2, 4, 13)], 1
+        )
+
+        assert result['predicted_speed'][0] < result['predicted_speed'][1]
+
+
+class TestPackedForest:
+    """Test suite for the array-only forest used at inference time."""
+
+    def test_matches_sklearn_trees(self, trained_predictor):
+        """Per-tree outputs on raw features match each sklearn estimator on scaled ones."""
+        history = _synthetic_traffic(50)
+        features = trained_predictor._feature_matrix(history['timestamp'], 3)
+        features_scaled = trained_predictor.scaler.transform(features)
+
+        per_tree = trained_predictor.speed_forest.predict_per_tree(features)
+        expected = np.stack([
+            tree.predict(features_scaled)
+            for tree in trained_predictor.speed_model.estimators_
+        ], axis=1)
+
+        np.testing.assert_allclose(per_tree, expected)
+        np.testing.assert_allclose(
+            per_tree.mean(axis=1), trained_predictor.speed_model.predict(features_scaled)
+        )
+
+    def test_threaded_walk_matches_inline(self, trained_predictor, monkeypatch):
+        """Splitting trees across threads gives the same matrix as one inline walk."""
+        features = trained_predictor._feature_matrix(_synthetic_traffic(200)['timestamp'], 1)
+        inline = trained_predictor.speed_forest.predict_per_tree(features)
+
+        monkeypatch.setattr(ai_predictor, "PARALLEL_MIN_WORK", 0)
+        monkeypatch.setattr(ai_predictor, "PARALLEL_JOBS", 4)
+        threaded = trained_predictor.speed_forest.predict_per_tree(features)
+
+        np.testing.assert_array_equal(threaded, inline)
+
+    def test_reload_from_disk(self, trained_predictor):
+        """A fresh predictor pointed at the same directory loads the packed forest."""
+        predictor = TrafficPredictor(model_path=trained_predictor.model_path)
+        t = datetime(2025, 2, 5, 18)
+
+        result = predictor.predict_speed(t, 1)
+
+        assert result['model'] == 'random_forest'
+        assert result == trained_predictor.predict_speed(t, 1)
+        assert isinstance(predictor.speed_forest.threshold, np.memmap)
+        # The sklearn model is not unpickled into the worker
+        assert predictor.speed_model is None
+
+    def test_legacy_save_without_packed_forest(self, trained_predictor, tmp_path):
+        """A save from before speed_forest.pkl existed is compiled from speed_model.pkl on load."""
+        for name in ('speed_model.pkl', 'scaler.pkl'):
+            shutil.copy(os.path.join(trained_predictor.model_path, name), tmp_path / name)
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+        t = datetime(2025, 2, 5, 18)
+
+        assert predictor.predict_speed(t, 1) == trained_predictor.predict_speed(t, 1)
+        assert predictor.speed_model is None
+
+    def test_unscaled_forest_still_scales_inputs(self, trained_predictor):
+        """A forest packed without a scaler (older saved models) gets scaled features."""
+        t = datetime(2025, 2, 6, 9)
+        expected = trained_predictor.predict_speed(t, 2)
+
+        predictor = TrafficPredictor(model_path=trained_predictor.model_path)
+        predictor.load_model('speed_model')
+        predictor.speed_forest = ai_predictor.PackedForest(trained_predictor.speed_model)
+
+        assert predictor.speed_forest.takes_raw_features is False
+        assert predictor.predict_speed(t, 2) == expected
+
+    def test_float32_thresholds_keep_split_decisions(self):
+        """Single-precision thresholds send every float32 input the same way as float64 ones."""
+        rng = np.random.default_rng(7)
+        thresholds = rng.normal(0, 3, 1000)
+        x = np.concatenate([
+            thresholds.astype(np.float32),
+            np.nextafter(thresholds.astype(np.float32), np.float32(np.inf)),
+            np.nextafter(thresholds.astype(np.float32), np.float32(-np.inf)),
+        ])
+        t64 = np.tile(thresholds, 3)
+
+        t32 = ai_predictor._float32_floor(t64)
+
+        assert t32.dtype == np.float32
+        np.testing.assert_array_equal(x <= t32, x <= t64)
+
+
+class TestPredictCongestion:
+    """Test suite for mapping speeds to congestion states."""
+
+    def test_batch_matches_scalar_mapping(self, tmp_path):
+        """Batch mapping agrees with predict_congestion, including band edges."""
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+        speeds = np.array([0.0, 9.99, 10.0, 19.5, 20.0, 34.9, 35.0, 49.99, 50.0, 80.0])
+
+        states = predictor.predict_congestion_batch(speeds)
+
+        assert states.tolist() == [predictor.predict_congestion(s) for s in speeds]
+
+
+class TestDetectAnomalies:
+    """Test suite for Isolation Forest anomaly detection."""
+
+    def test_flags_match_isolation_forest_predict(self, tmp_path):
+        """Flagged rows and scores agree with IsolationForest.predict/decision_function."""
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+        history = _synthetic_traffic(300)
+        current = _synthetic_traffic(120)
+        current.loc[::15, 'average_speed'] = 3.0
+        current.loc[5::15, 'vehicle_count'] = 400
+
+        detected = predictor.detect_anomalies(current, history)
+
+        X = current[['average_speed', 'vehicle_count']].values
+        flagged = np.flatnonzero(predictor.anomaly_detector.predict(X) == -1)
+        scores = -predictor.anomaly_detector.decision_function(X)[flagged]
+        assert [a['timestamp'] for a in detected] == current['timestamp'].iloc[flagged].tolist()
+        assert [a['anomaly_score'] for a in detected] == np.round(scores, 3).tolist()
+        slow = [a for a in detected if a['speed'] < 10]
+        assert slow and all(a['anomaly_type'] == 'severe_slowdown' for a in slow)
+        assert all(a['severity'] == 'critical' for a in slow)
+
+    def test_fit_is_reused_until_it_expires(self, tmp_path, monkeypatch):
+        """A fit is reused for any history until ANOMALY_REFIT_SECONDS, and shared once saved."""
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+        history = _synthetic_traffic(300)
+        current = _synthetic_traffic(120)
+
+        first = predictor.detect_anomalies(current, history)
+        fitted_at = predictor.anomaly_fitted_at
+        # A moving history window does not trigger a refit, and nothing is written on this path
+        assert predictor.detect_anomalies(current, history.iloc[10:]) == first
+        assert predictor.anomaly_fitted_at == fitted_at
+        assert not (tmp_path / 'iforest.pkl').exists()
+
+        predictor.save_model('anomaly_detector')
+        other = TrafficPredictor(model_path=str(tmp_path))
+        assert other.anomaly_detector_fresh()
+        assert other.detect_anomalies(current) == first
+        assert other.anomaly_fitted_at == fitted_at
+
+        monkeypatch.setattr(ai_predictor, 'ANOMALY_REFIT_SECONDS', 0)
+        assert not predictor.anomaly_detector_fresh()
+        predictor.detect_anomalies(current, history.iloc[10:])
+        assert predictor.anomaly_fitted_at > fitted_at
+
+    def test_accepts_column_arrays(self, tmp_path):
+        """A dict of numpy columns gives the same anomalies as the equivalent DataFrame."""
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+        history = _synthetic_traffic(300)
+        current = _synthetic_traffic(120)
+        current.loc[::15, 'average_speed'] = 3.0
+
+        from_frames = predictor.detect_anomalies(current, history)
+        from_arrays = predictor.detect_anomalies(
+            {column: current[column].to_numpy() for column in current.columns},
+            {column: history[column].to_numpy() for column in history.columns}
+        )
+
+        assert from_arrays == from_frames
+
+
+class TestRecommendRoute:
+    """Test suite for the heuristic route recommendation scores."""
+
+    def test_vehicle_adjustments(self, tmp_path):
+        """Bus and emergency weights adjust the base factor scores."""
+        predictor = TrafficPredictor(model_path=str(tmp_path))
+
+        car = predictor.recommend_route((23.0, 72.5), (23.1, 72.6), 'car', 'fastest')
+        bus = predictor.recommend_route((23.0, 72.5), (23.1, 72.6), 'bus', 'fastest')
+        emergency = predictor.recommend_route((23.0, 72.5), (23.1, 72.6), 'emergency', 'shortest')
+
+        assert car['factors']['safety_score'] == 0.9
+        assert bus['confidence'] == 0.798
+        assert bus['factors'] == {
+            'time_score': 0.85,
+            'distance_score': 0.75,
+            'safety_score': 0.99,
+            'predicted_traffic_score': 0.63
+        }
+        assert emergency['factors']['time_score'] == 0.72
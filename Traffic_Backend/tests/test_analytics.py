@@ -0,0 +1,223 @@
+"""
+Pytest tests for the analytics router.
+Runs the endpoints against a small seeded traffic table.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import mysql
+
+from Traffic_Backend.main import app
+from Traffic_Backend.db_config import engine, SessionLocal
+from Traffic_Backend.models import Base, RoadNetwork, TrafficDynamics
+from Traffic_Backend.routers import analytics
+from Traffic_Backend.routers.analytics import _generate_mock_speed_profiles
+
+client = TestClient(app)
+
+# (road_segment_id, hours ago, average_speed, vehicle_count)
+READINGS = [
+    (1, 1, 40.0, 20),
+    (1, 2, 35.0, 30),
+    (1, 26, 50.0, 10),
+    (2, 1, 12.0, 120),
+    (2, 3, 18.0, 90),
+    (3, 2, None, 60),
+]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add_all([RoadNetwork(id=i, name=f"Road {i}") for i in (1, 2, 3)])
+    now = datetime.now().replace(minute=30, second=0, microsecond=0)
+    db.add_all([
+        TrafficDynamics(
+            road_segment_id=segment_id,
+            timestamp=now - timedelta(hours=hours_ago),
+            average_speed=speed,
+            vehicle_count=count,
+            congestion_state='high' if count > 50 else 'low'
+        )
+        for segment_id, hours_ago, speed, count in READINGS
+    ])
+    db.commit()
+    db.close()
+    analytics._summary_cache.clear()
+    yield now
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_summary(seeded_db):
+    resp = client.get("/analytics/summary")
+    assert resp.status_code == 200
+    data = resp.json()
+
+    by_hour = {}
+    for _, hours_ago, _, count in READINGS:
+        hour = (seeded_db - timedelta(hours=hours_ago)).hour
+        by_hour[hour] = by_hour.get(hour, 0) + count
+
+    assert data["total_road_segments"] == 3
+    assert data["total_traffic_records"] == len(READINGS)
+    assert data["avg_speed_kmh"] == round((40 + 35 + 50 + 12 + 18) / 5, 2)
+    assert data["most_congested_segment"] == "Road 2"
+    assert data["peak_hour"] == max(by_hour, key=by_hour.get)
+
+
+
+def test_summary_is_cached_until_ttl(seeded_db, monkeypatch):
+    first = client.get("/analytics/summary").json()
+    db = SessionLocal()
+    db.add(TrafficDynamics(road_segment_id=1, timestamp=seeded_db, average_speed=10.0, vehicle_count=1))
+    db.commit()
+    try:
+        assert client.get("/analytics/summary").json() == first
+
+        monkeypatch.setitem(analytics._summary_cache, 'expires_at', 0.0)
+        refreshed = client.get("/analytics/summary").json()
+        assert refreshed["total_traffic_records"] == first["total_traffic_records"] + 1
+    finally:
+        db.query(TrafficDynamics).filter(TrafficDynamics.vehicle_count == 1).delete()
+        db.commit()
+        db.close()
+        analytics._summary_cache.clear()
+
+def test_hour_of_day_follows_timestamp(seeded_db):
+    db = SessionLocal()
+    try:
+        rows = db.query(TrafficDynamics).all()
+        assert all(row.hour_of_day == row.timestamp.hour for row in rows)
+
+        row = rows[0]
+        row.timestamp = row.timestamp.replace(hour=(row.timestamp.hour + 5) % 24)
+        db.flush()
+        assert row.hour_of_day == row.timestamp.hour
+        db.rollback()
+    finally:
+        db.close()
+
+
+def test_speed_profiles(seeded_db):
+    resp = client.get("/analytics/speed-profiles", params={"days": 7})
+    assert resp.status_code == 200
+    profiles = resp.json()
+
+    expected = {}
+    for _, hours_ago, speed, _ in READINGS:
+        hour = (seeded_db - timedelta(hours=hours_ago)).hour
+        expected.setdefault(hour, []).append(speed)
+
+    assert [p["hour"] for p in profiles] == sorted(expected)
+    for profile in profiles:
+        assert profile["sample_size"] == len(expected[profile["hour"]])
+
+
+def test_export_csv_streams_rows_in_time_order(seeded_db):
+    resp = client.get("/analytics/export/traffic-data", params={"hours": 24, "format": "csv"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+
+    lines = resp.text.splitlines()
+    recent = sorted((r for r in READINGS if r[1] <= 24), key=lambda r: -r[1])
+    assert lines[0] == "timestamp,road_name,vehicle_count,avg_speed_kmh,congestion_state,flow_entropy"
+    assert len(lines) == 1 + len(recent)
+    assert [line.split(",")[1] for line in lines[1:]] == [f"Road {r[0]}" for r in recent]
+
+
+def test_export_json(seeded_db):
+    resp = client.get("/analytics/export/traffic-data", params={"hours": 24, "format": "json"})
+    assert resp.status_code == 200
+    data = resp.json()
+
+    assert data["total_records"] == sum(1 for r in READINGS if r[1] <= 24)
+    assert [row["timestamp"] for row in data["data"]] == sorted(row["timestamp"] for row in data["data"])
+
+
+def test_mock_speed_profiles_follow_hour_bands():
+    profiles = _generate_mock_speed_profiles()
+
+    assert [p["hour"] for p in profiles] == list(range(24))
+    for p in profiles:
+        if p["hour"] in (7, 8, 9, 17, 18, 19):
+            assert 25 <= p["avg_speed"] <= 35 and 100 <= p["vehicle_count"] <= 150
+        elif p["hour"] >= 22 or p["hour"] <= 5:
+            assert 55 <= p["avg_speed"] <= 65 and 10 <= p["vehicle_count"] <= 25
+        else:
+            assert 40 <= p["avg_speed"] <= 50 and 50 <= p["vehicle_count"] <= 80
+        assert isinstance(p["vehicle_count"], int)
+
+
+def test_congestion_heatmap_scores_filters_and_sorts(seeded_db):
+    recent = {}
+    for segment_id, hours_ago, speed, count in READINGS:
+        if hours_ago <= 24:
+            recent.setdefault(segment_id, []).append((speed, count))
+    expected = {}
+    for segment_id, readings in recent.items():
+        speeds = [s for s, _ in readings if s is not None]
+        avg_speed = sum(speeds) / len(speeds) if speeds else 0
+        avg_count = sum(c for _, c in readings) / len(readings)
+        score = (min(avg_count / 50, 1.0) * 0.6 + (1 - min(avg_speed / 80, 1.0)) * 0.4) * 100
+        expected[segment_id] = round(score, 2)
+
+    resp = client.get("/analytics/congestion-heatmap", params={"hours": 24})
+    assert resp.status_code == 200
+    rows = resp.json()
+    assert {r["road_segment_id"]: r["congestion_score"] for r in rows} == expected
+    scores = [r["congestion_score"] for r in rows]
+    assert scores == sorted(scores, reverse=True)
+
+    threshold = sorted(expected.values())[1]
+    resp = client.get("/analytics/congestion-heatmap", params={"hours": 24, "min_congestion": threshold})
+    assert {r["road_segment_id"] for r in resp.json()} == {k for k, v in expected.items() if v >= threshold}
+
+
+def test_congestion_heatmap_limit_keeps_most_congested(seeded_db):
+    full = client.get("/analytics/congestion-heatmap", params={"hours": 24}).json()
+
+    resp = client.get("/analytics/congestion-heatmap", params={"hours": 24, "limit": 2})
+
+    assert resp.status_code == 200
+    assert resp.json() == full[:2]
+
+
+def test_trends_statement_is_portable_to_mysql():
+    sql = str(analytics._TRENDS_STMT[True].compile(dialect=mysql.dialect())).lower()
+
+    assert "strftime" not in sql
+    assert "date(traffic_dynamics.timestamp)" in sql and "traffic_dynamics.hour_of_day" in sql
+
+
+def test_speed_profiles_for_one_segment(seeded_db):
+    resp = client.get("/analytics/speed-profiles", params={"days": 7, "road_segment_id": 2})
+    assert resp.status_code == 200
+
+    expected = {
+        (seeded_db - timedelta(hours=hours_ago)).hour: speed
+        for segment_id, hours_ago, speed, _ in READINGS if segment_id == 2
+    }
+    assert {p["hour"]: p["avg_speed"] for p in resp.json()} == expected
+
+
+def test_traffic_trends_group_by_hour_and_state(seeded_db):
+    resp = client.get("/analytics/traffic-trends", params={"hours": 24})
+    assert resp.status_code == 200
+    trends = resp.json()
+
+    groups = {}
+    for _, hours_ago, speed, count in READINGS:
+        if hours_ago <= 24:
+            key = (hours_ago, 'high' if count > 50 else 'low')
+            groups.setdefault(key, []).append((speed, count))
+    expected = set()
+    for (_, state), readings in groups.items():
+        speeds = [s for s, _ in readings if s is not None]
+        avg_speed = round(sum(speeds) / len(speeds), 2) if speeds else 0
+        expected.add((avg_speed, sum(c for _, c in readings), state))
+
+    assert {(t["avg_speed"], t["vehicle_count"], t["congestion_state"]) for t in trends} == expected
+    assert [t["timestamp"] for t in trends] == sorted(t["timestamp"] for t in trends)
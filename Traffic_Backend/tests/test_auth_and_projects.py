@@ -14,7 +14,9 @@ def setup_db():
     # Ensure testing DB is clean: use the same dev sqlite DB that init_db created
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
-    yield
+    # Keep one lifespan and event loop open for every request in the module
+    with client:
+        yield
     Base.metadata.drop_all(bind=engine)
 
 
@@ -4,13 +4,14 @@ Tests for calculate_emission_savings function.
 """
 
 import pytest
+import numpy as np
 import sys
 import os
 
 # Add parent directory to path to import modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from emission_analytics import calculate_emission_savings
+from emission_analytics import calculate_emission_savings, calculate_emission_savings_batch
 
 
 class TestCalculateEmissionSavings:
@@ -138,6 +139,29 @@ class TestCalculateEmissionSavings:
         assert savings > 0, "Should be positive"
 
 
+class TestCalculateEmissionSavingsBatch:
+    """Test suite for calculate_emission_savings_batch function."""
+    
+    def test_matches_scalar_function(self):
+        """Batch results agree with the scalar function for valid and invalid pairs."""
+        time_original = np.array([2.0, 3.5, 1.0, 1.0, 2.0, 0.0, 1.0, 10.0, -1.0])
+        time_optimized = np.array([1.5, 2.0, 0.95, 1.5, 2.0, 0.0, -0.5, 1.0, 0.5])
+        
+        savings = calculate_emission_savings_batch(time_original, time_optimized)
+        
+        expected = [
+            calculate_emission_savings(t_orig, t_opt)
+            for t_orig, t_opt in zip(time_original, time_optimized)
+        ]
+        np.testing.assert_allclose(savings, expected, rtol=0, atol=1e-10)
+    
+    def test_empty_input(self):
+        """Empty arrays give an empty result."""
+        savings = calculate_emission_savings_batch(np.array([]), np.array([]))
+        
+        assert savings.shape == (0,)
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
@@ -0,0 +1,46 @@
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+
+from Traffic_Backend.main import app
+from Traffic_Backend.db_config import engine, SessionLocal
+from Traffic_Backend.models import Base, Notification
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    start = datetime(2024, 1, 1, 9)
+    db.add_all([
+        Notification(recipient_type="admin", message=f"message {i}", timestamp=start + timedelta(minutes=i))
+        for i in range(5)
+    ])
+    db.commit()
+    db.close()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_log_counts_all_and_returns_latest_page():
+    resp = client.get("/notifications/log", params={"limit": 2})
+    assert resp.status_code == 200
+    data = resp.json()
+
+    assert data["total"] == 5
+    assert [e["message"] for e in data["entries"]] == ["message 4", "message 3"]
+    assert data["entries"][0]["status"] == "sent"
+
+
+def test_log_limit_is_bounded():
+    assert client.get("/notifications/log", params={"limit": 0}).status_code == 422
+    assert client.get("/notifications/log", params={"limit": 100000}).status_code == 422
+
+
+def test_templates():
+    resp = client.get("/notifications/templates")
+    assert resp.status_code == 200
+    assert set(resp.json()["templates"]) == {"default_admin", "public_update"}
@@ -0,0 +1,367 @@
+"""
+Pytest unit tests for the routes router helpers.
+Tests for nearest-node lookup and alternative path search on the road network graph.
+"""
+
+import pytest
+import networkx as nx
+import numpy as np
+
+from Traffic_Backend.routers import routes
+from Traffic_Backend.graph_index import index_graph_nodes, edge_lengths_along
+from Traffic_Backend.routers.routes import (
+    _find_nearest_node, _find_alternatives, _cached_alternatives, clear_path_cache, _path_length, _polyline_length,
+    _generate_mock_alternatives, RouteAnalyzeRequest, _k_shortest_by_count
+)
+
+
+def _grid_graph(n: int = 12) -> nx.DiGraph:
+    """Directed grid of (lon, lat) nodes around Ahmedabad with unit-ish edge lengths."""
+    graph = nx.DiGraph()
+    nodes = [
+        (round(72.5 + 0.01 * i, 6), round(23.0 + 0.01 * j, 6))
+        for i in range(n) for j in range(n)
+    ]
+    graph.add_nodes_from(nodes)
+    for lon, lat in nodes:
+        for neighbour in ((round(lon + 0.01, 6), lat), (lon, round(lat + 0.01, 6))):
+            if neighbour in graph:
+                graph.add_edge((lon, lat), neighbour, length=0.01)
+                graph.add_edge(neighbour, (lon, lat), length=0.01)
+    return graph
+
+
+def _brute_force_nearest(point, graph):
+    return min(graph.nodes(), key=lambda node: (point[0] - node[0]) ** 2 + (point[1] - node[1]) ** 2)
+
+
+class TestFindNearestNode:
+    """Test suite for _find_nearest_node."""
+
+    def test_kdtree_matches_linear_scan(self):
+        """The indexed lookup returns the same node as a scan over all nodes."""
+        graph = _grid_graph()
+        index_graph_nodes(graph)
+        rng = np.random.default_rng(3)
+
+        for lon, lat in zip(rng.uniform(72.49, 72.62, 50), rng.uniform(22.99, 23.12, 50)):
+            assert _find_nearest_node((lon, lat), graph) == _brute_force_nearest((lon, lat), graph)
+
+    def test_coordinate_scan_without_kdtree(self):
+        """Without a KD-tree the cached coordinate array gives the same answer."""
+        graph = _grid_graph()
+        index_graph_nodes(graph)
+        graph.graph['kdtree'] = None
+        rng = np.random.default_rng(4)
+
+        for lon, lat in zip(rng.uniform(72.49, 72.62, 50), rng.uniform(22.99, 23.12, 50)):
+            assert _find_nearest_node((lon, lat), graph) == _brute_force_nearest((lon, lat), graph)
+
+    def test_index_built_lazily_and_rebuilt_after_change(self):
+        """An unindexed graph is indexed on first lookup and reindexed once it changes."""
+        graph = _grid_graph(4)
+
+        assert _find_nearest_node((72.6, 23.1), graph) == (72.53, 23.03)
+        assert graph.graph['indexed_size'] == (16, graph.number_of_edges())
+
+        graph.add_edge((72.53, 23.03), (72.6, 23.1), length=0.1)
+
+        assert _find_nearest_node((72.6, 23.1), graph) == (72.6, 23.1)
+
+    def test_returns_graph_node_key(self):
+        """The indexed lookup returns the node tuple itself, usable as a graph key."""
+        graph = _grid_graph()
+        index_graph_nodes(graph)
+
+        node = _find_nearest_node((72.5312, 23.0488), graph)
+
+        assert node == (72.53, 23.05)
+        assert node in graph
+
+    def test_empty_graph(self):
+        """An empty graph has no nearest node."""
+        graph = nx.DiGraph()
+        index_graph_nodes(graph)
+
+        assert _find_nearest_node((72.5, 23.0), graph) is None
+
+
+class TestFindAlternatives:
+    """Test suite for _find_alternatives."""
+
+    # Small hand-built network; coordinates only matter as node keys
+    A, B, C, D = (72.50, 23.00), (72.51, 23.00), (72.51, 23.01), (72.52, 23.01)
+
+    def test_returns_k_shortest_in_order(self):
+        """The k returned paths are the k shortest simple paths, shortest first, with their lengths."""
+        A, B, C, D = self.A, self.B, self.C, self.D
+        graph = nx.DiGraph()
+        graph.add_edge(A, B, length=1.0)
+        graph.add_edge(B, D, length=1.0)
+        graph.add_edge(A, C, length=1.5)
+        graph.add_edge(C, D, length=1.0)
+        graph.add_edge(A, D, length=3.0)
+        graph.add_edge(B, C, length=0.2)
+
+        alternatives = _find_alternatives(A, D, graph, k=3)
+
+        assert [path for path, _ in alternatives] == [[A, B, D], [A, B, C, D], [A, C, D]]
+        assert [length for _, length in alternatives] == pytest.approx([2.0, 2.2, 2.5])
+
+    def test_grid_paths_are_sorted_and_distinct(self):
+        """On a grid the alternatives are distinct and non-decreasing in length."""
+        graph = _grid_graph(6)
+        start, end = (72.5, 23.0), (72.55, 23.05)
+
+        alternatives = _find_alternatives(start, end, graph, k=3)
+
+        lengths = [length for _, length in alternatives]
+        assert len(alternatives) == 3
+        assert len({tuple(path) for path, _ in alternatives}) == 3
+        assert lengths == sorted(lengths)
+        assert lengths[0] == pytest.approx(0.1)
+        for path, length in alternatives:
+            assert length == pytest.approx(sum(graph[u][v]['length'] for u, v in zip(path, path[1:])))
+
+    def test_cached_alternatives_reuse_results_until_cleared(self):
+        """Repeat lookups for the same node pair are served from the cache until it is cleared."""
+        graph = _grid_graph(6)
+        start, end = (72.5, 23.0), (72.55, 23.05)
+        clear_path_cache()
+
+        first = _cached_alternatives(graph, start, end, 3)
+
+        assert [(list(path), length) for path, length in first] == _find_alternatives(start, end, graph, k=3)
+        assert _cached_alternatives(graph, start, end, 3) is first
+        assert _cached_alternatives.cache_info().hits == 1
+
+        clear_path_cache()
+        assert _cached_alternatives.cache_info().currsize == 0
+
+    def test_count_pruned_search_on_large_graphs(self, monkeypatch):
+        """Past YEN_MAX_NODES the count-pruned search gives distinct simple paths, shortest first."""
+        graph = _grid_graph(6)
+        start, end = (72.5, 23.0), (72.55, 23.05)
+        monkeypatch.setattr(routes, "YEN_MAX_NODES", 10)
+
+        alternatives = _find_alternatives(start, end, graph, k=3)
+
+        lengths = [length for _, length in alternatives]
+        assert len({tuple(path) for path, _ in alternatives}) == 3
+        assert all(len(set(path)) == len(path) for path, _ in alternatives)
+        assert lengths == sorted(lengths)
+        assert lengths[0] == pytest.approx(0.1)
+
+    def test_count_pruned_search_matches_yen_on_small_network(self):
+        A, B, C, D = self.A, self.B, self.C, self.D
+        graph = nx.DiGraph()
+        graph.add_weighted_edges_from(
+            [(A, B, 1.0), (B, D, 1.0), (A, C, 1.5), (C, D, 1.0), (A, D, 3.0), (B, C, 0.2)], weight='length'
+        )
+
+        assert _k_shortest_by_count(graph, A, D, k=3) == [[A, B, D], [A, B, C, D], [A, C, D]]
+        assert _k_shortest_by_count(graph, D, A, k=3) == []
+
+    def test_count_pruned_search_drops_looping_walks(self):
+        """A walk through a cycle neither counts as a path nor uses up the target's settlements."""
+        A, B, C, D = self.A, self.B, self.C, self.D
+        E = (72.59, 23.01)
+        graph = nx.DiGraph()
+        graph.add_weighted_edges_from(
+            [(A, B, 1.0), (B, D, 1.0), (B, C, 0.1), (C, E, 0.1), (E, B, 0.1), (A, D, 5.0)], weight='length'
+        )
+
+        assert _k_shortest_by_count(graph, A, D, k=2) == [[A, B, D], [A, D]]
+
+    def test_short_pruned_result_falls_back_to_shortest_path(self, monkeypatch):
+        """When the pruned search comes up empty on a connected pair, the shortest path is still returned."""
+        graph = _grid_graph(4)
+        start, end = (72.5, 23.0), (72.53, 23.03)
+        monkeypatch.setattr(routes, "YEN_MAX_NODES", 10)
+        monkeypatch.setattr(routes, "_k_shortest_by_count", lambda *args: [])
+
+        [(path, length)] = _find_alternatives(start, end, graph, k=3)
+
+        assert path == nx.shortest_path(graph, start, end, weight='length')
+        assert length == pytest.approx(0.06)
+
+    def test_no_path(self):
+        """Disconnected nodes give no alternatives."""
+        graph = nx.DiGraph()
+        graph.add_edge(self.A, self.B, length=1.0)
+        graph.add_node(self.C)
+
+        assert _find_alternatives(self.A, self.C, graph) == []
+        assert _find_alternatives(self.A, self.D, graph) == []
+
+
+class TestPathLength:
+    """Test suite for _path_length."""
+
+    def test_edge_table_matches_adjacency(self):
+        """The indexed edge table gives the same length as walking the adjacency dicts."""
+        graph = _grid_graph(6)
+        index_graph_nodes(graph)
+
+        for path, _ in _find_alternatives((72.5, 23.0), (72.55, 23.05), graph, k=5):
+            expected = sum(graph[u][v]['length'] for u, v in zip(path, path[1:]))
+            assert _path_length(path, graph) == pytest.approx(expected)
+            assert _path_length(path, graph) == pytest.approx(0.1)
+
+    def test_edge_lengths_along_path(self):
+        """Per-edge lengths come back in path order, whatever order the edges were added in."""
+        a, b, c, d = (72.53, 23.0), (72.5, 23.0), (72.52, 23.0), (72.51, 23.0)
+        graph = nx.DiGraph()
+        graph.add_edge(c, d, length=3.0)
+        graph.add_edge(a, b, length=1.0)
+        graph.add_edge(b, c, length=2.0)
+        index_graph_nodes(graph)
+
+        assert edge_lengths_along(graph, [a, b, c, d]).tolist() == [1.0, 2.0, 3.0]
+        assert edge_lengths_along(graph, [c, d]).tolist() == [3.0]
+
+    def test_missing_length_counts_as_zero(self):
+        """Edges without a length attribute contribute nothing, as with dict.get."""
+        a, b, c = (72.5, 23.0), (72.51, 23.0), (72.52, 23.0)
+        graph = nx.DiGraph()
+        graph.add_edge(a, b, length=2.5)
+        graph.add_edge(b, c)
+
+        assert _path_length([a, b, c], graph) == 2.5
+        assert _path_length([a], graph) == 0.0
+
+
+class TestRouteMetrics:
+    """Test suite for the route metrics endpoint."""
+
+    @pytest.fixture
+    def client(self):
+        from fastapi.testclient import TestClient
+        from Traffic_Backend.main import app
+        from Traffic_Backend.db_config import engine
+        from Traffic_Backend.models import Base
+
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        yield TestClient(app)
+        Base.metadata.drop_all(bind=engine)
+
+    def _seed(self, readings):
+        from datetime import datetime
+        from Traffic_Backend.db_config import SessionLocal
+        from Traffic_Backend.models import RoadNetwork, TrafficDynamics
+
+        db = SessionLocal()
+        db.add_all([RoadNetwork(id=1, name="Road 1", base_capacity=100), RoadNetwork(id=2, name="Road 2")])
+        db.add_all([
+            TrafficDynamics(road_segment_id=segment_id, timestamp=datetime(2024, 1, 1, 8), vehicle_count=count, average_speed=speed)
+            for segment_id, count, speed in readings
+        ])
+        db.commit()
+        db.close()
+
+    def test_aggregates_segment_readings(self, client):
+        """Counts are summed and speeds averaged over the segment, skipping NULLs."""
+        self._seed([(1, 10, 30.0), (1, None, 50.0), (1, 5, None), (2, 99, 5.0)])
+
+        data = client.get("/routes/1/metrics").json()
+
+        assert data["segment_name"] == "Road 1"
+        assert data["base_capacity"] == 100
+        assert data["vehicle_count_sum"] == 15
+        assert data["average_speed"] == pytest.approx(40.0)
+
+    def test_segment_without_readings(self, client):
+        """A segment with no traffic rows has a zero count and no speed."""
+        self._seed([(1, 10, 30.0)])
+
+        data = client.get("/routes/2/metrics").json()
+
+        assert data["vehicle_count_sum"] == 0
+        assert data["average_speed"] is None
+
+    def test_unknown_segment(self, client):
+        self._seed([])
+
+        assert client.get("/routes/3/metrics").status_code == 404
+
+
+class TestPolylineLength:
+    """Test suite for _polyline_length."""
+
+    def test_matches_shapely(self):
+        from shapely.geometry import LineString
+
+        rng = np.random.default_rng(5)
+        for n in (2, 3, 10):
+            coords = np.column_stack([rng.uniform(72.4, 72.7, n), rng.uniform(22.9, 23.2, n)]).tolist()
+            assert _polyline_length(coords) == pytest.approx(LineString(coords).length, rel=1e-12)
+
+    def test_right_angle(self):
+        assert _polyline_length([[0.0, 0.0], [3.0, 0.0], [3.0, 4.0]]) == pytest.approx(7.0)
+
+
+class TestMockAlternatives:
+    """Test suite for _generate_mock_alternatives."""
+
+    def test_distances_match_variant_coordinates(self):
+        payload = RouteAnalyzeRequest(
+            start_lon=72.55, start_lat=23.02, end_lon=72.60, end_lat=23.06,
+            waypoints=[{"lon": 72.57, "lat": 23.05}]
+        )
+
+        routes = _generate_mock_alternatives(payload)["routes"]
+
+        assert [r["rank"] for r in routes] == [1, 2, 3]
+        assert routes[1]["coordinates"] == [[72.55, 23.02], [72.57, 23.05], [72.60, 23.06]]
+        for route in routes:
+            assert len(route["coordinates"]) == 3
+            assert route["distance_km"] == pytest.approx(round(_polyline_length(route["coordinates"]) * 111, 4))
+            assert route["travel_time_min"] == max(1, int(route["distance_km"] * 2))
+            assert isinstance(route["emission_g"], int)
+
+
+class TestAlternativesEndpoint:
+    """Test suite for the alternatives and recommend endpoints."""
+
+    @pytest.fixture
+    def client(self):
+        from fastapi.testclient import TestClient
+        from Traffic_Backend.main import app
+
+        graph = _grid_graph(6)
+        index_graph_nodes(graph)
+        app.state.road_network_graph = graph
+        clear_path_cache()
+        yield TestClient(app)
+        app.state.road_network_graph = None
+        clear_path_cache()
+
+    PARAMS = {"start_lon": 72.5001, "start_lat": 23.0001, "end_lon": 72.5499, "end_lat": 23.0499}
+
+    def test_alternatives_use_app_graph(self, client):
+        data = client.get("/routes/7/alternatives", params=self.PARAMS).json()
+
+        assert data["route_id"] == 7
+        assert [alt["rank"] for alt in data["alternatives"]] == [1, 2, 3]
+        assert all(alt["length_km"] == pytest.approx(11.1) for alt in data["alternatives"])
+
+    def test_recommend_uses_app_graph(self, client):
+        data = client.post("/routes/7/recommend", params=self.PARAMS).json()
+
+        assert data["recommended_alternative_id"] == 0
+        assert len(data["all_alternatives"]) == 3
+
+    def test_recommend_reuses_alternatives_search(self, client):
+        alternatives = client.get("/routes/7/alternatives", params=self.PARAMS).json()["alternatives"]
+        data = client.post("/routes/7/recommend", params=self.PARAMS).json()
+
+        assert data["all_alternatives"] == alternatives
+        assert _cached_alternatives.cache_info().hits == 1
+
+    def test_no_graph_loaded(self, client):
+        from Traffic_Backend.main import app
+
+        app.state.road_network_graph = None
+
+        assert client.get("/routes/7/alternatives", params=self.PARAMS).status_code == 400
@@ -0,0 +1,127 @@
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+
+from Traffic_Backend.main import app
+from Traffic_Backend.db_config import engine, SessionLocal
+from Traffic_Backend.models import Base, RoadNetwork, TrafficDynamics
+from Traffic_Backend.routers import traffic
+
+client = TestClient(app)
+
+START = datetime(2024, 1, 1, 8)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add_all([RoadNetwork(id=1, name="Road 1"), RoadNetwork(id=2, name="Road 2")])
+    db.add_all([
+        TrafficDynamics(
+            road_segment_id=1 + i % 2,
+            timestamp=START + timedelta(minutes=10 * i),
+            vehicle_count=i,
+            average_speed=30.0 + i,
+            congestion_state="low"
+        )
+        for i in range(10)
+    ])
+    db.commit()
+    db.close()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_history_newest_first():
+    resp = client.get("/traffic/history/1", params={"limit": 3})
+    assert resp.status_code == 200
+    data = resp.json()
+
+    assert data["count"] == 3
+    assert [e["vehicle_count"] for e in data["entries"]] == [8, 6, 4]
+    assert data["entries"][0] == {
+        "timestamp": (START + timedelta(minutes=80)).isoformat(),
+        "vehicle_count": 8,
+        "avg_speed": 38.0,
+        "congestion_state": "low"
+    }
+
+
+def test_live_latest_entry():
+    data = client.get("/traffic/live/2").json()
+
+    assert data["vehicle_count"] == 9
+    assert client.get("/traffic/live/3").status_code == 404
+
+
+def test_analyze_only_after_row_count_changes(monkeypatch):
+    monkeypatch.setattr(traffic, "_analyzed_row_counts", {})
+    db = SessionLocal()
+    try:
+        assert all(traffic._refresh_planner_stats(db).values())
+        assert not any(traffic._refresh_planner_stats(db).values())
+
+        db.add_all([TrafficDynamics(road_segment_id=1, timestamp=START, vehicle_count=0) for _ in range(2)])
+        db.commit()
+        analyzed = traffic._refresh_planner_stats(db)
+        assert analyzed == {"traffic_dynamics": True, "road_network": False, "traffic_thresholds": False}
+
+        assert all(traffic._refresh_planner_stats(db, force=True).values())
+    finally:
+        db.query(TrafficDynamics).filter(TrafficDynamics.vehicle_count == 0, TrafficDynamics.average_speed.is_(None)).delete()
+        db.commit()
+        db.close()
+
+
+def test_analyze_requires_admin():
+    assert client.post("/traffic/maintenance/analyze").status_code == 401
+
+
+def test_configure_threshold_upserts_one_row_per_segment():
+    from Traffic_Backend.models import TrafficThreshold
+
+    db = SessionLocal()
+    try:
+        traffic.configure_threshold(traffic.TrafficThreshold(route_id=1, vehicle_count_limit=50), db)
+        traffic.configure_threshold(traffic.TrafficThreshold(route_id=1, vehicle_count_limit=80, density_limit=0.5), db)
+
+        rows = db.query(TrafficThreshold).filter(TrafficThreshold.road_segment_id == 1).all()
+        assert [(r.vehicle_count_limit, r.density_limit, r.is_active) for r in rows] == [(80, 0.5, 1)]
+        assert client.get("/traffic/threshold/1").json()["threshold"] == {"vehicle_count_limit": 80, "density_limit": 0.5}
+    finally:
+        db.query(TrafficThreshold).delete()
+        db.commit()
+        db.close()
+
+
+def test_mock_generators_share_one_timestamp():
+    now = datetime(2024, 1, 1, 12)
+
+    segments = traffic._generate_mock_traffic_segments(now.isoformat())
+    alerts = traffic._generate_mock_alerts(now)
+
+    assert {s["timestamp"] for s in segments} == {now.isoformat()}
+    for alert in alerts:
+        assert timedelta(minutes=5) <= now - datetime.fromisoformat(alert["timestamp"]) <= timedelta(minutes=60)
+
+
+def test_mock_segments_follow_congestion():
+    segments = traffic._generate_mock_traffic_segments()
+
+    assert [s["segment_id"] for s in segments] == [f"seg_{i:03d}" for i in range(1, 9)]
+    for s in segments:
+        assert 0.1 <= s["congestion_level"] <= 0.9
+        assert isinstance(s["speed_kmh"], int) and 10 <= s["speed_kmh"] <= 60
+        assert isinstance(s["vehicle_count"], int) and 50 <= s["vehicle_count"] <= 200
+
+
+def test_mock_alerts_pick_known_types_and_places():
+    alerts = traffic._generate_mock_alerts()
+
+    assert 2 <= len(alerts) <= 4
+    assert [a["id"] for a in alerts] == list(range(1, len(alerts) + 1))
+    for alert in alerts:
+        assert alert["area"] in alert["message"]
+        assert alert["affected_routes"] == ([1, 2] if alert["severity"] == "high" else [])
@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from Traffic_Backend.main import app
+from Traffic_Backend.db_config import engine, SessionLocal
+from Traffic_Backend.models import Base, User
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(id=1, username="ravi", email="ravi@example.com", hashed_password="x"))
+    db.commit()
+    db.close()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_get_user():
+    assert client.get("/users/1").json() == {"id": 1, "username": "ravi", "email": "ravi@example.com"}
+    assert client.get("/users/2").status_code == 404
+
+
+def test_update_user_returns_committed_values():
+    resp = client.put("/users/1", json={"email": "ravi@navdrishti.in"})
+
+    assert resp.status_code == 200
+    assert resp.json() == {"id": 1, "username": "ravi", "email": "ravi@navdrishti.in"}
+    assert client.get("/users/1").json()["email"] == "ravi@navdrishti.in"
+    assert client.put("/users/2", json={"email": "x@example.com"}).status_code == 404
@@ -0,0 +1,427 @@
+import asyncio
+import json
+import zlib
+from datetime import datetime
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from Traffic_Backend.main import app
+from Traffic_Backend.db_config import engine, get_db, SessionLocal
+from Traffic_Backend.models import Base, Vehicle
+from Traffic_Backend.routers import vehicles
+
+client = TestClient(app)
+
+FLEET = [("BUS-1", "bus"), ("BUS-2", "bus"), ("AMB-1", "emergency")]
+
+
+def _driver_autocommit(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+def _emit_begin(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # pysqlite defers BEGIN to the first write, which breaks SAVEPOINTs; let SQLAlchemy
+    # emit it instead (no-op on other backends, where transactions already work)
+    if engine.dialect.name == "sqlite":
+        engine.dispose()
+        event.listen(engine, "connect", _driver_autocommit)
+        event.listen(engine, "begin", _emit_begin)
+    # One lifespan and one event loop for the whole module, as under a real server
+    with client:
+        yield
+    if engine.dialect.name == "sqlite":
+        event.remove(engine, "connect", _driver_autocommit)
+        event.remove(engine, "begin", _emit_begin)
+        engine.dispose()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(autouse=True)
+def fleet():
+    # Each test runs inside a transaction that is rolled back afterwards; the handlers'
+    # commits only release SAVEPOINTs, so nothing a test writes outlives it
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    app.dependency_overrides[get_db] = lambda: session
+    vehicles._status_cache.clear()
+    vehicles._list_cache.clear()
+    for vehicle_id, vehicle_type in FLEET:
+        client.post("/vehicles/register", json={"vehicle_id": vehicle_id, "vehicle_type": vehicle_type})
+    yield
+    app.dependency_overrides.pop(get_db, None)
+    session.close()
+    transaction.rollback()
+    connection.close()
+
+
+def test_register_returns_new_vehicle():
+    resp = client.post("/vehicles/register", json={"vehicle_id": "TRK-1", "vehicle_type": "truck", "driver_name": "Meena"})
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert (data["vehicle_id"], data["driver_name"], data["status"]) == ("TRK-1", "Meena", "offline")
+    assert data["id"] == client.get("/vehicles/TRK-1").json()["id"]
+
+
+@pytest.mark.parametrize("insert_returning", [True, False])
+def test_register_rejects_duplicates(monkeypatch, insert_returning):
+    monkeypatch.setattr(engine.dialect, "insert_returning", insert_returning)
+
+    resp = client.post("/vehicles/register", json={"vehicle_id": "BUS-1", "vehicle_type": "truck"})
+
+    assert resp.status_code == 400
+    assert client.get("/vehicles/BUS-1").json()["vehicle_type"] == "bus"
+    assert client.post("/vehicles/register", json={"vehicle_id": "BUS-9", "vehicle_type": "bus"}).status_code == 200
+
+
+def test_get_vehicle():
+    data = client.get("/vehicles/AMB-1").json()
+
+    assert data["vehicle_type"] == "emergency"
+    assert data["status"] == "offline"
+    assert client.get("/vehicles/NOPE").status_code == 404
+
+
+def test_filters_combine():
+    client.post("/vehicles/BUS-2/status", params={"status": "idle"})
+
+    def ids(**params):
+        return sorted(v["vehicle_id"] for v in client.get("/vehicles/", params=params).json())
+
+    assert ids() == ["AMB-1", "BUS-1", "BUS-2"]
+    assert ids(vehicle_type="bus") == ["BUS-1", "BUS-2"]
+    assert ids(status="offline") == ["AMB-1", "BUS-1"]
+    assert ids(status="idle", vehicle_type="bus") == ["BUS-2"]
+    assert ids(status="idle", vehicle_type="emergency") == []
+
+
+def test_listing_is_cached_until_a_write(monkeypatch):
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    first = client.get("/vehicles/", params={"vehicle_type": "bus"})
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        # Served from the cache, byte for byte
+        assert client.get("/vehicles/", params={"vehicle_type": "bus"}).content == first.content
+        assert statements == []
+
+        # A status change drops the cached listings
+        client.post("/vehicles/BUS-1/status", params={"status": "idle"})
+        statements.clear()
+        listed = client.get("/vehicles/", params={"vehicle_type": "bus"}).json()
+        assert statements
+        assert {v["vehicle_id"]: v["status"] for v in listed} == {"BUS-1": "idle", "BUS-2": "offline"}
+
+        # And so does expiry
+        monkeypatch.setattr(vehicles, "LIST_CACHE_TTL_SECONDS", 0)
+        statements.clear()
+        client.get("/vehicles/", params={"vehicle_type": "bus"})
+        assert statements
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+def test_listing_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(vehicles, "LIST_CACHE_MAX_ENTRIES", 3)
+
+    for n in range(5):
+        client.get("/vehicles/", params={"vehicle_type": f"type-{n}"})
+    client.get("/vehicles/", params={"status": "no-such-status"})
+
+    # Oldest filters are evicted first, and unknown statuses are never stored
+    assert list(vehicles._list_cache) == [(None, "type-2"), (None, "type-3"), (None, "type-4")]
+
+
+def test_location_update_marks_vehicle_active():
+    resp = client.post("/vehicles/BUS-1/location", json={"lat": 23.03, "lon": 72.58, "speed": 32.5})
+    assert resp.status_code == 200
+
+    data = client.get("/vehicles/BUS-1").json()
+    assert (data["current_lat"], data["current_lon"], data["speed"], data["status"]) == (23.03, 72.58, 32.5, "active")
+    assert client.post("/vehicles/NOPE/location", json={"lat": 0, "lon": 0}).status_code == 404
+
+
+def test_status_validation_and_deregister():
+    assert client.post("/vehicles/BUS-1/status", params={"status": "flying"}).status_code == 400
+    assert client.post("/vehicles/NOPE/status", params={"status": "idle"}).status_code == 404
+
+    assert client.delete("/vehicles/BUS-1").json() == {"message": "Vehicle deregistered", "vehicle_id": "BUS-1"}
+    assert client.get("/vehicles/BUS-1").status_code == 404
+    assert client.delete("/vehicles/BUS-1").status_code == 404
+
+
+class _FakeSocket:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_bytes(self, data):
+        if self.fail:
+            raise RuntimeError("socket closed")
+        self.sent.append(data)
+
+
+def test_broadcast_queues_per_socket_and_drops_dead_or_slow_ones(monkeypatch):
+    monkeypatch.setattr(vehicles, "OUTBOUND_QUEUE_SIZE", 2)
+    monkeypatch.setattr(vehicles, "COALESCE_WINDOW_SECONDS", 0)
+    manager = vehicles.ConnectionManager()
+    alive, dead, slow = _FakeSocket(), _FakeSocket(fail=True), _FakeSocket()
+
+    async def scenario():
+        for socket in (alive, dead):
+            await manager.connect(socket)
+        manager.broadcast({"type": "ping", "n": 1})
+        await asyncio.sleep(0.01)
+
+        # The slow client never gets a turn to drain, so its third queued message overflows
+        await manager.connect(slow)
+        manager.writers[slow].cancel()
+        for n in range(3):
+            manager.broadcast({"type": "ping", "n": n})
+            await asyncio.sleep(0.01)
+        for socket in list(manager.active_connections):
+            manager.disconnect(socket)
+
+    asyncio.run(scenario())
+
+    assert [json.loads(text)["n"] for text in alive.sent] == [1, 0, 1, 2]
+    assert dead.sent == [] and slow.sent == []
+    assert manager.active_connections == set() and manager.writers == {}
+
+
+def test_writer_coalesces_bursts_into_batch_frames(monkeypatch):
+    monkeypatch.setattr(vehicles, "COALESCE_MAX_BYTES", 60)
+    manager = vehicles.ConnectionManager()
+    socket = _FakeSocket()
+
+    async def scenario():
+        await manager.connect(socket)
+        for n in range(5):
+            manager.broadcast({"type": "ping", "n": n})
+        await asyncio.sleep(0.2)
+        manager.broadcast({"type": "ping", "n": 5})
+        await asyncio.sleep(0.2)
+        manager.disconnect(socket)
+
+    asyncio.run(scenario())
+
+    frames = [json.loads(text) for text in socket.sent]
+    # 21-byte messages: the third one pushes a batch past 60 bytes and flushes it early
+    assert frames == [
+        {"type": "batch", "items": [{"type": "ping", "n": 0}, {"type": "ping", "n": 1}, {"type": "ping", "n": 2}]},
+        {"type": "batch", "items": [{"type": "ping", "n": 3}, {"type": "ping", "n": 4}]},
+        {"type": "ping", "n": 5},
+    ]
+
+
+def test_websocket_receives_location_updates():
+    with client.websocket_connect("/vehicles/ws") as ws:
+        client.post("/vehicles/AMB-1/location", json={"lat": 23.0, "lon": 72.5})
+        ws.send_text("ping")
+        message = ws.receive_json(mode="binary")
+
+    assert message["type"] == "location_update"
+    assert message["vehicle_id"] == "AMB-1"
+    assert message["data"]["vehicle_type"] == "emergency"
+    assert message["data"]["timestamp"] == client.get("/vehicles/AMB-1").json()["last_update"]
+
+
+def test_compressing_clients_share_one_deflate_per_frame():
+    vehicles._deflate.cache_clear()
+    manager = vehicles.ConnectionManager()
+    plain, first, second = _FakeSocket(), _FakeSocket(), _FakeSocket()
+
+    async def scenario():
+        await manager.connect(plain)
+        for socket in (first, second):
+            await manager.connect(socket, compress=True)
+        manager.broadcast({"type": "ping", "n": 0})
+        await asyncio.sleep(0.2)
+        for socket in list(manager.active_connections):
+            manager.disconnect(socket)
+
+    asyncio.run(scenario())
+
+    assert first.sent == second.sent and len(first.sent) == 1
+    assert zlib.decompress(first.sent[0], -15) == plain.sent[0]
+    assert json.loads(plain.sent[0]) == {"type": "ping", "n": 0}
+    assert vehicles._deflate.cache_info().misses == 1
+
+
+def test_websocket_deflate_raw_frames():
+    with client.websocket_connect("/vehicles/ws?compress=deflate-raw") as ws:
+        client.post("/vehicles/BUS-1/location", json={"lat": 23.0, "lon": 72.5})
+        message = json.loads(zlib.decompress(ws.receive_bytes(), -15))
+
+    assert (message["type"], message["vehicle_id"]) == ("location_update", "BUS-1")
+
+
+def test_location_update_without_returning_support(monkeypatch):
+    monkeypatch.setattr(engine.dialect, "update_returning", False)
+
+    resp = client.post("/vehicles/BUS-2/location", json={"lat": 23.1, "lon": 72.6, "heading": 180.0})
+    assert resp.status_code == 200
+    data = client.get("/vehicles/BUS-2").json()
+    assert (data["current_lat"], data["heading"], data["status"]) == (23.1, 180.0, "active")
+    assert client.post("/vehicles/NOPE/location", json={"lat": 0, "lon": 0}).status_code == 404
+
+
+def test_status_write_is_one_statement_and_ignores_stale_cache():
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    assert client.post("/vehicles/BUS-1/status", params={"status": "idle"}).status_code == 200
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        # One UPDATE, whose rowcount also says whether the vehicle exists
+        assert client.post("/vehicles/BUS-1/status", params={"status": "idle"}).json()["status"] == "idle"
+        # (SAVEPOINT bookkeeping comes from the test's rollback fixture)
+        assert [verb for verb in (statement.split()[0] for statement in statements) if verb not in ("SAVEPOINT", "RELEASE")] == ["UPDATE"]
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    # Another worker's writes never reach this process's cache; the database still decides
+    vehicles._status_cache["BUS-2"] = "idle"
+    client.post("/vehicles/BUS-2/status", params={"status": "idle"})
+    assert client.get("/vehicles/BUS-2").json()["status"] == "idle"
+
+    client.delete("/vehicles/BUS-1")
+    vehicles._status_cache["BUS-1"] = "idle"
+    assert client.post("/vehicles/BUS-1/status", params={"status": "idle"}).status_code == 404
+
+
+class _FakeRedis:
+    def __init__(self, messages=(), failing_listens=0, publish_error=None):
+        self.published = []
+        self.messages = list(messages)
+        self.failing_listens = failing_listens
+        self.publish_error = publish_error
+
+    async def publish(self, channel, payload):
+        if self.publish_error is not None:
+            raise self.publish_error
+        self.published.append((channel, payload))
+
+    def pubsub(self):
+        return self
+
+    async def subscribe(self, channel):
+        self.subscribed = channel
+
+    async def listen(self):
+        if self.failing_listens:
+            self.failing_listens -= 1
+            raise ConnectionError("connection reset")
+        for message in self.messages:
+            yield message
+
+    async def reset(self):
+        self.subscribed = None
+
+
+def test_location_updates_publish_to_redis_when_configured(monkeypatch):
+    redis = _FakeRedis()
+    monkeypatch.setattr(vehicles, "_redis", redis)
+    monkeypatch.setattr(vehicles, "_relay_live", True)
+    local = []
+    monkeypatch.setattr(vehicles.manager, "broadcast_payload", local.append)
+
+    client.post("/vehicles/BUS-1/location", json={"lat": 23.0, "lon": 72.5})
+
+    assert local == []
+    [(channel, payload)] = redis.published
+    assert channel == vehicles.UPDATES_CHANNEL
+    assert json.loads(payload)["vehicle_id"] == "BUS-1"
+
+
+def test_relay_forwards_channel_messages_to_local_sockets(monkeypatch):
+    redis = _FakeRedis([
+        {"type": "subscribe", "data": 1},
+        {"type": "message", "data": b'{"type":"location_update"}'},
+    ])
+    local = []
+    monkeypatch.setattr(vehicles.manager, "broadcast_payload", local.append)
+
+    asyncio.run(vehicles._relay_updates(redis))
+
+    assert local == [b'{"type":"location_update"}']
+    assert redis.subscribed is None
+
+
+def test_publish_falls_back_to_local_clients(monkeypatch):
+    local = []
+    monkeypatch.setattr(vehicles.manager, "broadcast_payload", local.append)
+
+    # Redis down: the committed update still succeeds and reaches this worker's sockets
+    monkeypatch.setattr(vehicles, "_redis", _FakeRedis(publish_error=ConnectionError("refused")))
+    monkeypatch.setattr(vehicles, "_relay_live", True)
+    assert client.post("/vehicles/BUS-1/location", json={"lat": 23.0, "lon": 72.5}).status_code == 200
+    assert len(local) == 1
+
+    # Publishing works but this worker's relay is resubscribing: other workers get it through
+    # Redis, local sockets directly
+    redis = _FakeRedis()
+    monkeypatch.setattr(vehicles, "_redis", redis)
+    monkeypatch.setattr(vehicles, "_relay_live", False)
+    client.post("/vehicles/BUS-2/location", json={"lat": 23.0, "lon": 72.5})
+    assert len(redis.published) == 1 and len(local) == 2
+
+
+def test_relay_resubscribes_after_connection_loss(monkeypatch):
+    redis = _FakeRedis([{"type": "message", "data": b'{"type":"location_update"}'}], failing_listens=2)
+    local = []
+    monkeypatch.setattr(vehicles.manager, "broadcast_payload", local.append)
+    monkeypatch.setattr(vehicles, "RELAY_RETRY_SECONDS", 0)
+
+    asyncio.run(vehicles._relay_updates(redis))
+
+    assert redis.failing_listens == 0
+    assert local == [b'{"type":"location_update"}']
+    assert vehicles._relay_live is False
+
+
+@pytest.mark.parametrize("vehicle_id,speed,heading", [
+    ("BUS-1", 32.5, 90.0),
+    ('odd "id" \\ ü', None, float("nan")),
+])
+def test_location_frame_matches_encoded_message(vehicle_id, speed, heading):
+    location = vehicles.VehicleLocation(lat=23.033863, lon=72.585022, speed=speed, heading=heading)
+    now = datetime(2025, 1, 15, 10, 30, 0, 123456)
+
+    frame = vehicles._location_frame(vehicle_id, location, "bus", now)
+
+    assert orjson.loads(frame) == orjson.loads(orjson.dumps({
+        "type": "location_update",
+        "vehicle_id": vehicle_id,
+        "data": {
+            "lat": 23.033863, "lon": 72.585022, "speed": speed, "heading": heading,
+            "vehicle_type": "bus", "status": "active", "timestamp": now
+        }
+    }))
+
+
+def test_writes_are_rolled_back_between_tests():
+    client.post("/vehicles/register", json={"vehicle_id": "TMP-1", "vehicle_type": "bus"})
+
+    # Visible inside the test's transaction, but never committed to the database
+    assert client.get("/vehicles/TMP-1").status_code == 200
+    with SessionLocal() as other:
+        assert other.query(Vehicle).count() == 0